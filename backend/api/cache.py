@@ -0,0 +1,103 @@
+"""Кэш не зависящей от пользователя части представления рецептов."""
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Recipe
+from users.serializers import MyUserSerializer
+from users.viewer_state import get_viewer_state
+
+from .serializers import RecipeDocumentSerializer, RecipeReadSerializer
+
+RECIPE_DOCUMENT_VERSION = 2
+
+
+def recipe_document_key(recipe):
+    """
+    Ключ документа рецепта.
+
+    Изменения рецепта обновляют updated_at, поэтому прежний документ
+    больше не читается ни одним процессом и истекает сам.
+    """
+    return f'recipe-document:{recipe.id}:{recipe.updated_at.isoformat()}'
+
+
+def get_recipe_documents(recipes):
+    """
+    Документы рецептов в порядке recipes.
+
+    Берутся из кэша одним запросом, промахи заполняются
+    одним набором запросов к базе данных.
+    """
+    keys = {recipe_document_key(recipe): recipe.id for recipe in recipes}
+    documents = {
+        keys[key]: document for key, document in cache.get_many(
+            keys, version=RECIPE_DOCUMENT_VERSION
+        ).items()
+    }
+    missing = [recipe.id for recipe in recipes if recipe.id not in documents]
+    if missing:
+        recipes_by_id = Recipe.objects.filter(
+            pk__in=missing
+        ).with_related().in_bulk()
+        fresh = {
+            document['id']: document for document in
+            RecipeDocumentSerializer(
+                recipes_by_id.values(), many=True
+            ).data
+        }
+        cache.set_many(
+            {
+                recipe_document_key(recipes_by_id[recipe_id]): document
+                for recipe_id, document in fresh.items()
+            },
+            timeout=settings.RECIPE_CACHE_TIMEOUT,
+            version=RECIPE_DOCUMENT_VERSION
+        )
+        documents.update(fresh)
+    return [
+        documents[recipe.id] for recipe in recipes if recipe.id in documents
+    ]
+
+
+def _absolute_uri(request, url):
+    return request.build_absolute_uri(url) if url else url
+
+
+def _absolute_uris(request, urls):
+    return {key: _absolute_uri(request, url) for key, url in urls.items()}
+
+
+def render_recipes(recipes, request):
+    """Представление рецептов: документы из кэша и признаки пользователя."""
+    documents = get_recipe_documents(recipes)
+    state = get_viewer_state(request)
+    state.prime(
+        [document['id'] for document in documents],
+        [document['author']['id'] for document in documents]
+    )
+    results = []
+    for document in documents:
+        author = {
+            **document['author'],
+            'avatar': _absolute_uri(request, document['author']['avatar']),
+            'avatar_variants': _absolute_uris(
+                request, document['author']['avatar_variants']
+            ),
+            'is_subscribed': state.is_subscribed(document['author']['id']),
+        }
+        values = {
+            **document,
+            'author': {
+                field: author[field] for field in MyUserSerializer.Meta.fields
+            },
+            'image': _absolute_uri(request, document['image']),
+            'image_variants': _absolute_uris(
+                request, document['image_variants']
+            ),
+            'is_favorited': state.is_favorited(document['id']),
+            'is_in_shopping_cart': state.is_in_shopping_cart(document['id']),
+        }
+        results.append({
+            field: values[field] for field in RecipeReadSerializer.Meta.fields
+        })
+    return results
@@ -0,0 +1,54 @@
+"""Кэш справочников тегов и ингредиентов в памяти процесса."""
+from collections import OrderedDict
+from threading import Lock
+
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import CatalogVersion
+
+from .constants import CATALOG_CACHE_MAX_ENTRIES
+
+
+class CatalogCache:
+    """
+    Готовые JSON-ответы справочника для его последней известной версии.
+
+    Версия хранится в базе данных, поэтому каждый процесс замечает
+    изменения, сделанные другими процессами, и сбрасывает свои ответы.
+    """
+
+    def __init__(self, max_entries=CATALOG_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def _is_current(self, version):
+        if self.version is None or version > self.version:
+            self.version = version
+            self.entries.clear()
+        return version == self.version
+
+    def get(self, version, key):
+        """Готовый ответ в байтах либо None."""
+        with self.lock:
+            if not self._is_current(version) or key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, version, key, data):
+        """Сохранение сериализованных данных в виде байтов JSON."""
+        body = JSONRenderer().render(data)
+        with self.lock:
+            if self._is_current(version):
+                self.entries[key] = body
+                if len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return body
+
+
+catalog_caches = {
+    CatalogVersion.TAGS: CatalogCache(),
+    CatalogVersion.INGREDIENTS: CatalogCache(),
+}
@@ -0,0 +1,6 @@
+CATALOG_CACHE_MAX_ENTRIES = 512
+INGREDIENT_SEARCH_LIMIT = 50
+SHOPPING_LIST_CACHE_MAX_SIZE = 1024 * 1024
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+BULK_RECIPES_LIMIT = 100
+IMPORT_BATCH_SIZE = 1000
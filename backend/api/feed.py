@@ -0,0 +1,71 @@
+"""Лента рецептов авторов, на которых подписан пользователь."""
+import heapq
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+
+from recipes.constants import FEED_FANOUT_MAX_FOLLOWERS
+from recipes.models import Recipe, TimelineEntry
+
+User = get_user_model()
+
+
+def after(position, date_field, id_field):
+    """Условие для записей после позиции (pub_date, id) в порядке убывания."""
+    if position is None:
+        return Q()
+    pub_date, pk = position
+    return Q(**{f'{date_field}__lt': pub_date}) | Q(
+        **{date_field: pub_date, f'{id_field}__lt': pk}
+    )
+
+
+class SubscriptionFeed:
+    """
+    Лента подписок пользователя, новые рецепты первыми.
+
+    Рецепты обычных авторов читаются из TimelineEntry, рецепты
+    популярных авторов - из Recipe по индексу (author, pub_date).
+    Оба потока упорядочены по (pub_date, id) и сливаются при чтении.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def popular_author_ids(self):
+        return list(User.objects.filter(
+            subscriptions__user=self.user,
+            followers_count__gt=FEED_FANOUT_MAX_FOLLOWERS
+        ).order_by().values_list('id', flat=True))
+
+    def page(self, position, size):
+        """Рецепты ленты после позиции (pub_date, id), не больше size."""
+        popular = self.popular_author_ids()
+        streams = [
+            TimelineEntry.objects.filter(
+                after(position, 'pub_date', 'recipe_id'), user=self.user
+            ).exclude(author_id__in=popular).order_by(
+                '-pub_date', '-recipe_id'
+            ).values_list('pub_date', 'recipe_id')[:size]
+        ]
+        if popular:
+            streams.append(
+                Recipe.objects.filter(
+                    after(position, 'pub_date', 'id'), author_id__in=popular
+                ).order_by('-pub_date', '-id').values_list(
+                    'pub_date', 'id'
+                )[:size]
+            )
+        recipe_ids = [
+            recipe_id for _, recipe_id in islice(
+                heapq.merge(*streams, reverse=True), size
+            )
+        ]
+        recipes = Recipe.objects.only(
+            'id', 'pub_date', 'updated_at', 'author'
+        ).in_bulk(recipe_ids)
+        return [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]
@@ -1,7 +1,12 @@
-from django_filters.filters import CharFilter, ModelMultipleChoiceFilter
+from django.db.models import Case, Exists, OuterRef, When
+from django_filters.filters import (CharFilter, ChoiceFilter,
+                                    ModelMultipleChoiceFilter)
 from django_filters.rest_framework import BooleanFilter, FilterSet
 
 from recipes.models import Ingredient, Recipe, Tag
+from users.viewer_state import get_viewer_state
+
+from .ingredient_index import ingredient_index
 
 
 class RecipeFilter(FilterSet):
@@ -12,29 +17,81 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         to_field_name='slug',
-        conjoined=False,
+        method='filter_tags',
+    )
+    tags_match = ChoiceFilter(
+        choices=(('any', 'any'), ('all', 'all')),
+        method='filter_tags_match',
     )
     is_favorited = BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='filter_is_in_shopping_cart')
+    search = CharFilter(method='filter_search')
+
+    def filter_search(self, queryset, name, value):
+        """Поиск рецептов, упорядоченных по релевантности."""
+        return queryset.search(value)
+
+    def filter_tags(self, queryset, name, value):
+        """
+        Рецепты с любым (по умолчанию) или со всеми из переданных тегов.
+
+        Проверка через EXISTS по таблице связи не размножает строки
+        рецептов, поэтому DISTINCT не нужен.
+        """
+        if not value:
+            return queryset
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk')
+        )
+        tag_ids = [tag.id for tag in value]
+        if self.form.cleaned_data.get('tags_match') == 'all':
+            for tag_id in tag_ids:
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tag_id=tag_id))
+                )
+            return queryset
+        return queryset.filter(Exists(recipe_tags.filter(tag_id__in=tag_ids)))
+
+    def filter_tags_match(self, queryset, name, value):
+        """Режим сопоставления тегов учитывается в filter_tags."""
+        return queryset
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
+            state = get_viewer_state(self.request)
+            if state.load():
+                return queryset.filter(pk__in=state.favorites)
             return queryset.filter(favorites__user=self.request.user)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
+            state = get_viewer_state(self.request)
+            if state.load():
+                return queryset.filter(pk__in=state.shopping_cart)
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart',)
+        fields = (
+            'author', 'tags', 'tags_match',
+            'is_favorited', 'is_in_shopping_cart', 'search',
+        )
 
 
 class IngredientFilter(FilterSet):
     """Кастомный фильтр для ингредиентов."""
-    name = CharFilter(lookup_expr='startswith')
+    name = CharFilter(method='filter_name')
+
+    def filter_name(self, queryset, name, value):
+        """Поиск по началу названия через индекс ингредиентов."""
+        ids = ingredient_index.search(value)
+        if ids is None:
+            return queryset.filter(name__istartswith=value)
+        return queryset.filter(pk__in=ids).order_by(Case(*(
+            When(pk=pk, then=position) for position, pk in enumerate(ids)
+        )))
 
     class Meta:
         model = Ingredient
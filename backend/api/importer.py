@@ -0,0 +1,474 @@
+"""Пакетный импорт справочников и фикстур из CSV, JSON и JSON Lines."""
+import csv
+import json
+import os
+from collections import defaultdict
+from io import StringIO
+from itertools import islice
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from foodgram.counters import count_of
+from foodgram.images import schedule_variants
+from recipes.constants import RECIPE_IMAGE_VARIANTS
+from recipes.models import (CatalogVersion, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag,
+                            TimelineEntry)
+
+from .ingredient_index import schedule_ingredient_index_rebuild
+from .signals import muted_signals, touch_recipes
+
+User = get_user_model()
+
+STAGING_TABLE = 'import_staging'
+
+
+def read_rows(path):
+    """
+    Строки файла по одной.
+
+    CSV и JSON Lines читаются потоком, JSON - целиком,
+    это должен быть список объектов.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8') as file:
+        if extension == '.csv':
+            yield from csv.DictReader(file)
+        elif extension == '.jsonl':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.json':
+            rows = json.load(file)
+            if not isinstance(rows, list):
+                raise CommandError(f'{path}: expected a list of objects.')
+            yield from rows
+        else:
+            raise CommandError(
+                f'{path}: unsupported file type, use .csv, .json or .jsonl.'
+            )
+
+
+def copy_value(value):
+    """Значение в текстовом формате COPY."""
+    if value is None:
+        return r'\N'
+    return str(value).replace('\\', '\\\\').replace(
+        '\t', '\\t'
+    ).replace('\n', '\\n').replace('\r', '\\r')
+
+
+class ModelImport:
+    """
+    Импорт строк в модель с обновлением по естественному ключу.
+
+    key - поля естественного ключа, fields - поля, которые обновляются
+    у существующих объектов, create_fields - поля, которые пишутся
+    только в новые объекты. Объекты без изменений не перезаписываются,
+    поэтому повторный импорт того же файла ничего не меняет.
+    """
+    model = None
+    key = ()
+    fields = ()
+    create_fields = ()
+    supports_copy = True
+
+    def __init__(self, path):
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self.processed = self.created = self.updated = 0
+
+    def can_copy(self):
+        """Слияние через COPY: PostgreSQL и уникальный ключ из одного поля."""
+        return (
+            self.supports_copy
+            and connection.vendor == 'postgresql'
+            and len(self.key) == 1
+            and self.model._meta.get_field(self.key[0]).unique
+        )
+
+    def attnames(self, fields):
+        return [self.model._meta.get_field(field).attname for field in fields]
+
+    def key_of(self, obj):
+        return tuple(getattr(obj, name) for name in self.attnames(self.key))
+
+    def build(self, rows, start):
+        """Объекты модели из строк файла, начиная с номера start."""
+        fields = (*self.key, *self.fields, *self.create_fields)
+        objects = []
+        for number, row in enumerate(rows, start):
+            try:
+                obj = self.build_object(row)
+                obj.clean_fields(exclude=[
+                    field.name for field in self.model._meta.fields
+                    if field.name not in fields or field.is_relation
+                ])
+            except KeyError as error:
+                raise CommandError(
+                    f'{self.path}, row {number}: missing field {error}.'
+                )
+            except OSError as error:
+                raise CommandError(f'{self.path}, row {number}: {error}.')
+            except ValidationError as error:
+                raise CommandError(
+                    f'{self.path}, row {number}: {error.messages}.'
+                )
+            objects.append(obj)
+        return list({self.key_of(obj): obj for obj in objects}.values())
+
+    def build_object(self, row):
+        fields = (*self.key, *self.fields, *self.create_fields)
+        return self.model(**{
+            field: self.model._meta.get_field(field).to_python(row[field])
+            for field in fields
+        })
+
+    def prepare_created(self, objects):
+        """Подготовка новых объектов перед записью."""
+
+    def upsert(self, objects):
+        """
+        Запись объектов пакета запросами ORM.
+
+        Возвращает id созданных и изменённых объектов.
+        """
+        key_names = self.attnames(self.key)
+        field_names = self.attnames(self.fields)
+        existing = {}
+        for pk, *values in self.model.objects.filter(**{
+            f'{name}__in': {getattr(obj, name) for obj in objects}
+            for name in key_names
+        }).values_list('pk', *key_names, *field_names):
+            existing[tuple(values[:len(key_names)])] = (
+                pk, tuple(values[len(key_names):])
+            )
+        created, changed = [], []
+        for obj in objects:
+            if self.key_of(obj) not in existing:
+                created.append(obj)
+                continue
+            obj.pk, values = existing[self.key_of(obj)]
+            if tuple(getattr(obj, name) for name in field_names) != values:
+                changed.append(obj)
+        if created:
+            self.prepare_created(created)
+            self.model.objects.bulk_create(created)
+            if created[0].pk is None:
+                self.fill_pks(created)
+        if changed:
+            now = timezone.now()
+            auto_now = [
+                field.name for field in self.model._meta.concrete_fields
+                if getattr(field, 'auto_now', False)
+            ]
+            for obj in changed:
+                for name in auto_now:
+                    setattr(obj, name, now)
+            self.model.objects.bulk_update(changed, [*self.fields, *auto_now])
+        return [obj.pk for obj in created], [obj.pk for obj in changed]
+
+    def fill_pks(self, objects):
+        """id объектов после bulk_create в СУБД без RETURNING."""
+        key_names = self.attnames(self.key)
+        pks = {
+            tuple(values): pk for pk, *values in self.model.objects.filter(**{
+                f'{name}__in': {getattr(obj, name) for obj in objects}
+                for name in key_names
+            }).values_list('pk', *key_names)
+        }
+        for obj in objects:
+            obj.pk = pks[self.key_of(obj)]
+
+    def upsert_copy(self, objects):
+        """
+        Запись объектов пакета через COPY во временную таблицу.
+
+        Строки переносятся в таблицу модели одним INSERT ... ON CONFLICT,
+        существующие строки обновляются, только если значения изменились.
+        """
+        self.prepare_created(objects)
+        meta = self.model._meta
+        quote = connection.ops.quote_name
+        table = quote(meta.db_table)
+        fields = [field for field in meta.concrete_fields
+                  if not field.primary_key]
+        columns = ', '.join(quote(field.column) for field in fields)
+        updated = [
+            quote(meta.get_field(field).column) for field in self.fields
+        ]
+        content = StringIO()
+        for obj in objects:
+            content.write('\t'.join(
+                copy_value(field.get_db_prep_save(
+                    getattr(obj, field.attname), connection
+                ))
+                for field in fields
+            ) + '\n')
+        content.seek(0)
+        if updated:
+            conflict = (
+                'DO UPDATE SET '
+                + ', '.join(f'{column} = EXCLUDED.{column}'
+                            for column in updated)
+                + ' WHERE ('
+                + ', '.join(f'{table}.{column}' for column in updated)
+                + ') IS DISTINCT FROM ('
+                + ', '.join(f'EXCLUDED.{column}' for column in updated)
+                + ')'
+            )
+        else:
+            conflict = 'DO NOTHING'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} ({columns}) FROM STDIN', content
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) '
+                f'SELECT {columns} FROM {STAGING_TABLE} '
+                f'ON CONFLICT ({quote(meta.get_field(self.key[0]).column)}) '
+                f'{conflict} '
+                f'RETURNING {table}.{quote(meta.pk.column)}, xmax = 0'
+            )
+            rows = cursor.fetchall()
+        return (
+            [pk for pk, inserted in rows if inserted],
+            [pk for pk, inserted in rows if not inserted]
+        )
+
+    def after_batch(self, objects, created, changed):
+        """Обновление связанных данных после записи пакета."""
+
+    def finish(self):
+        """Обновление связанных данных после импорта всего файла."""
+
+    def run(self, batch_size, use_copy=False, report=None):
+        """Импорт файла пакетами по batch_size строк."""
+        started = monotonic()
+        rows = read_rows(self.path)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                objects = self.build(batch, self.processed + 1)
+                created, changed = (
+                    self.upsert_copy if use_copy else self.upsert
+                )(objects)
+                self.after_batch(objects, created, changed)
+            self.processed += len(batch)
+            self.created += len(created)
+            self.updated += len(changed)
+            if report is not None:
+                report(self, monotonic() - started)
+        self.finish()
+        return monotonic() - started
+
+
+class IngredientImport(ModelImport):
+    """Импорт ингредиентов."""
+    model = Ingredient
+    key = ('name',)
+    fields = ('measurement_unit',)
+
+    def after_batch(self, objects, created, changed):
+        touch_recipes(IngredientInRecipe.objects.filter(
+            ingredient_id__in=changed
+        ).values_list('recipe_id', flat=True).distinct())
+
+    def finish(self):
+        if self.created or self.updated:
+            CatalogVersion.bump(CatalogVersion.INGREDIENTS)
+            schedule_ingredient_index_rebuild()
+
+
+class TagImport(ModelImport):
+    """Импорт тегов."""
+    model = Tag
+    key = ('slug',)
+    fields = ('name',)
+
+    def after_batch(self, objects, created, changed):
+        touch_recipes(Recipe.tags.through.objects.filter(
+            tag_id__in=changed
+        ).values_list('recipe_id', flat=True).distinct())
+
+    def finish(self):
+        if self.created or self.updated:
+            CatalogVersion.bump(CatalogVersion.TAGS)
+
+
+class UserImport(ModelImport):
+    """
+    Импорт пользователей.
+
+    Пароль задаётся только новым пользователям,
+    без пароля в строке вход по паролю невозможен.
+    """
+    model = User
+    key = ('email',)
+    fields = ('username', 'first_name', 'last_name')
+    supports_copy = False
+
+    def build_object(self, row):
+        user = super().build_object(row)
+        user.raw_password = row.get('password')
+        return user
+
+    def prepare_created(self, objects):
+        for user in objects:
+            user.password = make_password(user.raw_password)
+
+
+class RecipeImport(ModelImport):
+    """
+    Импорт рецептов с тегами и ингредиентами.
+
+    Автор задаётся email, теги - списком slug, ингредиенты - списком
+    объектов с name и amount, изображение - путём к файлу относительно
+    файла фикстуры. Поддерживаются только JSON и JSON Lines.
+    """
+    model = Recipe
+    key = ('author', 'name')
+    fields = ('text', 'cooking_time', 'image')
+    supports_copy = False
+
+    def __init__(self, path):
+        if path.lower().endswith('.csv'):
+            raise CommandError(f'{path}: recipes are imported from JSON.')
+        super().__init__(path)
+        self.images = {}
+
+    def build(self, rows, start):
+        self.authors = User.objects.in_bulk(
+            {row.get('author') for row in rows}, field_name='email'
+        )
+        self.tags = Tag.objects.in_bulk(
+            {slug for row in rows for slug in row.get('tags', ())},
+            field_name='slug'
+        )
+        self.ingredients = Ingredient.objects.in_bulk(
+            {item.get('name') for row in rows
+             for item in row.get('ingredients', ())},
+            field_name='name'
+        )
+        return super().build(rows, start)
+
+    def lookup(self, objects, value, kind):
+        if value not in objects:
+            raise ValidationError(f'Unknown {kind} {value}.')
+        return objects[value]
+
+    def save_image(self, path):
+        """Сохранение файла изображения, одинаковые пути - один раз."""
+        path = os.path.join(self.directory, path)
+        if path not in self.images:
+            upload_to = Recipe._meta.get_field('image').upload_to
+            with open(path, 'rb') as file:
+                self.images[path] = default_storage.save(
+                    upload_to + os.path.basename(path), File(file)
+                )
+        return self.images[path]
+
+    def build_object(self, row):
+        recipe = Recipe(
+            author=self.lookup(self.authors, row['author'], 'author'),
+            name=row['name'],
+            text=row['text'],
+            cooking_time=Recipe._meta.get_field('cooking_time').to_python(
+                row['cooking_time']
+            ),
+            image=self.save_image(row['image']),
+        )
+        recipe.imported_tags = {
+            self.lookup(self.tags, slug, 'tag').pk for slug in row['tags']
+        }
+        recipe.imported_ingredients = {}
+        for item in row['ingredients']:
+            ingredient = self.lookup(self.ingredients, item['name'],
+                                     'ingredient')
+            amount = IngredientInRecipe._meta.get_field('amount').to_python(
+                item['amount']
+            )
+            if amount < 1:
+                raise ValidationError(f'Wrong amount of {item["name"]}.')
+            recipe.imported_ingredients[ingredient.pk] = amount
+        return recipe
+
+    def after_batch(self, objects, created, changed):
+        recipe_ids = [recipe.pk for recipe in objects]
+        tags = defaultdict(set)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'tag_id'):
+            tags[recipe_id].add(tag_id)
+        ingredients = defaultdict(dict)
+        for recipe_id, ingredient_id, amount in (
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).values_list('recipe_id', 'ingredient_id', 'amount')
+        ):
+            ingredients[recipe_id][ingredient_id] = amount
+        stale = [
+            recipe for recipe in objects
+            if recipe.imported_tags != tags[recipe.pk]
+            or recipe.imported_ingredients != ingredients[recipe.pk]
+        ]
+        if stale:
+            self.replace_relations(stale)
+        created = set(created)
+        touched = set(changed) | {
+            recipe.pk for recipe in stale if recipe.pk not in created
+        }
+        self.updated += len(touched) - len(changed)
+        touch_recipes(touched)
+        new_recipes = [recipe for recipe in objects if recipe.pk in created]
+        if new_recipes:
+            User.objects.filter(
+                pk__in={recipe.author_id for recipe in new_recipes}
+            ).update(recipes_count=count_of(Recipe, 'author'))
+            TimelineEntry.fan_out_many(new_recipes)
+        for recipe in objects:
+            if recipe.pk in created or recipe.pk in touched:
+                schedule_variants(
+                    recipe, 'image', 'image_variants', RECIPE_IMAGE_VARIANTS
+                )
+
+    def replace_relations(self, recipes):
+        """Замена тегов и ингредиентов рецептов одним набором запросов."""
+        recipe_ids = [recipe.pk for recipe in recipes]
+        Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids).delete()
+        # Списки покупок пересобираются ниже целиком.
+        with muted_signals(IngredientInRecipe):
+            IngredientInRecipe.objects.filter(
+                recipe_id__in=recipe_ids
+            ).delete()
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe in recipes for tag_id in recipe.imported_tags
+        ])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for recipe in recipes
+            for ingredient_id, amount in recipe.imported_ingredients.items()
+        ])
+        user_ids = list(ShoppingCart.objects.filter(
+            recipes_id__in=recipe_ids
+        ).values_list('user_id', flat=True).distinct())
+        if user_ids:
+            ShoppingListItem.rebuild(user_ids)
@@ -0,0 +1,183 @@
+"""
+Индекс префиксного поиска ингредиентов.
+
+Индекс собирается из таблицы Ingredient в один файл, который каждый
+процесс отображает в память через mmap, поэтому все воркеры делят
+одну копию данных. Формат файла (числа - unsigned int в порядке байтов
+машины, на которой собран индекс):
+
+    заголовок: MAGIC, количество записей
+    ids[count]            - id ингредиентов в порядке ключей
+    usages[count]         - число рецептов с ингредиентом
+    offsets[count + 1]    - смещения ключей в блоке ключей
+    keys                  - нормализованные названия в UTF-8, по возрастанию
+"""
+import heapq
+import mmap
+import os
+import tempfile
+from array import array
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from recipes.models import CatalogVersion, Ingredient
+
+from .constants import INGREDIENT_SEARCH_LIMIT
+
+MAGIC = b'FGII0001'
+ITEM_SIZE = array('I').itemsize
+# Байт 0xff не встречается в UTF-8, поэтому все ключи с префиксом
+# меньше, чем префикс с этим байтом на конце.
+PREFIX_UPPER_BOUND = b'\xff'
+
+
+def normalize(name):
+    """Ключ поиска: без учёта регистра, ё и лишних пробелов."""
+    return ' '.join(name.casefold().replace('ё', 'е').split())
+
+
+def build_ingredient_index(path=None, rank_by_usage=True):
+    """Сборка индекса из базы данных с атомарной заменой файла."""
+    path = path or settings.INGREDIENT_INDEX_PATH
+    ingredients = Ingredient.objects.order_by()
+    if rank_by_usage:
+        ingredients = ingredients.annotate(usage=Count('ingredients_list'))
+        rows = ingredients.values_list('id', 'name', 'usage')
+    else:
+        rows = ((pk, name, 0) for pk, name in ingredients.values_list(
+            'id', 'name'))
+    entries = sorted(
+        (normalize(name).encode('utf-8'), pk, usage)
+        for pk, name, usage in rows
+    )
+    ids, usages, offsets = array('I'), array('I'), array('I', [0])
+    for key, pk, usage in entries:
+        ids.append(pk)
+        usages.append(usage)
+        offsets.append(offsets[-1] + len(key))
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        file.write(MAGIC)
+        file.write(array('I', [len(entries)]).tobytes())
+        for part in (ids, usages, offsets):
+            file.write(part.tobytes())
+        for key, _, _ in entries:
+            file.write(key)
+    os.replace(file.name, path)
+    return len(entries)
+
+
+def _rebuild_after_commit():
+    build_ingredient_index()
+    # Ответы, закэшированные до замены файла, собраны по старому индексу.
+    CatalogVersion.bump(CatalogVersion.INGREDIENTS)
+
+
+def schedule_ingredient_index_rebuild():
+    """Одна пересборка индекса после фиксации текущей транзакции."""
+    connection = transaction.get_connection()
+    if not any(
+        callback[1] is _rebuild_after_commit
+        for callback in connection.run_on_commit
+    ):
+        transaction.on_commit(_rebuild_after_commit)
+
+
+class MappedIndex:
+    """Отображённый в память файл индекса."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            self.signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} не является индексом ингредиентов.')
+        view = memoryview(self.buffer)
+        start = len(MAGIC)
+        self.count = view[start:start + ITEM_SIZE].cast('I')[0]
+        start += ITEM_SIZE
+        self.ids, start = self._array(view, start, self.count)
+        self.usages, start = self._array(view, start, self.count)
+        self.offsets, start = self._array(view, start, self.count + 1)
+        self.keys_start = start
+
+    @staticmethod
+    def _array(view, start, length):
+        end = start + length * ITEM_SIZE
+        return view[start:end].cast('I'), end
+
+    def key(self, position):
+        return self.buffer[
+            self.keys_start + self.offsets[position]:
+            self.keys_start + self.offsets[position + 1]
+        ]
+
+    def bisect(self, key):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def search(self, prefix, limit):
+        key = normalize(prefix).encode('utf-8')
+        low = self.bisect(key)
+        high = self.bisect(key + PREFIX_UPPER_BOUND)
+        positions = range(low, high)
+        if any(self.usages[low:high]):
+            positions = heapq.nsmallest(
+                limit, positions,
+                key=lambda position: (-self.usages[position], position)
+            )
+        return [self.ids[position] for position in positions[:limit]]
+
+
+class IngredientIndex:
+    """
+    Префиксный поиск ингредиентов по файлу индекса.
+
+    Перед поиском проверяется, не был ли файл пересобран,
+    и при необходимости он отображается в память заново.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.mapped = None
+        self.lock = Lock()
+
+    def current(self):
+        path = self.path or settings.INGREDIENT_INDEX_PATH
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        mapped = self.mapped
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if mapped is None or mapped.signature != signature:
+            with self.lock:
+                if self.mapped is None or self.mapped.signature != signature:
+                    self.mapped = MappedIndex(path)
+                mapped = self.mapped
+        return mapped
+
+    def search(self, prefix, limit=INGREDIENT_SEARCH_LIMIT):
+        """
+        Id ингредиентов, названия которых начинаются с prefix.
+
+        Сначала самые используемые в рецептах. None, если индекс не собран.
+        """
+        mapped = self.current()
+        if mapped is None:
+            return None
+        return mapped.search(prefix, limit)
+
+
+ingredient_index = IngredientIndex()
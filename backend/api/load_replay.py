@@ -0,0 +1,289 @@
+"""Нагрузочное воспроизведение сценариев из Postman-коллекции."""
+import json
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from http.client import HTTPConnection, HTTPException
+from random import Random
+from threading import Thread
+from time import monotonic, perf_counter, sleep
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import CommandError
+
+VARIABLE = re.compile(r'{{(\w+)}}')
+# Верхние границы корзин гистограммы задержек, мс.
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Сценарий - последовательность запросов коллекции по их названиям.
+# Изменения в конце сценария отменяются, поэтому данные не копятся.
+SCENARIOS = {
+    'browse': (
+        'get_recipes_list // No Auth',
+        'get_recipe_detail // No Auth',
+        'get_recipe_short_link // No Auth',
+        'get_profile // No Auth',
+        'get_tag_list // No Auth',
+        'get_ingredients_list_with_name_filter // User',
+    ),
+    'filter': (
+        'get_recipes_list // User',
+        'get_recipes_list_with_limit_param // User',
+        'get_recipes_list_with_author_param // User',
+        'get_recipes_list_with_two_tags_param // User',
+        'get_recipes_list_with_is_favorited_param // User',
+        'get_recipes_list_with_is_in_shopping_cart_param // User',
+    ),
+    'favorite': (
+        'add_to_favorite // User',
+        'get_recipes_list_with_is_favorited_param // User',
+        'remove_from_favorite // User',
+    ),
+    'cart': (
+        'add_to_shopping_cart // User',
+        'get_recipes_list_with_is_in_shopping_cart_param // User',
+        'remove_from_shopping_cart // User',
+    ),
+    'download': (
+        'add_to_shopping_cart // User',
+        'download_shopping_cart // User',
+        'remove_from_shopping_cart // User',
+    ),
+    'subscribe': (
+        'create_subscription // User',
+        'get_subscription_list_with_recipes_limit_param // User',
+        'delete_first_subscription // User',
+    ),
+}
+DEFAULT_WEIGHTS = {
+    'browse': 45,
+    'filter': 25,
+    'favorite': 10,
+    'cart': 8,
+    'download': 5,
+    'subscribe': 7,
+}
+
+
+def walk_items(items):
+    for item in items:
+        if 'item' in item:
+            yield from walk_items(item['item'])
+        else:
+            yield item
+
+
+def load_collection(path, names):
+    """
+    Запросы коллекции с названиями names.
+
+    Из запроса берутся метод, путь без {{baseUrl}}, тело и заголовок
+    авторизации типа apikey, скрипты тестов не выполняются.
+    """
+    with open(path, encoding='utf-8') as file:
+        collection = json.load(file)
+    found = {}
+    for item in walk_items(collection['item']):
+        if item['name'] not in names:
+            continue
+        if item['name'] in found:
+            raise CommandError(
+                f'Request {item["name"]} is not unique in {path}.'
+            )
+        request = item['request']
+        url = request['url']
+        auth = request.get('auth') or {}
+        headers = {}
+        if auth.get('type') == 'apikey':
+            apikey = {
+                option['key']: option['value'] for option in auth['apikey']
+            }
+            headers[apikey['key']] = apikey['value']
+        body = (request.get('body') or {}).get('raw') or ''
+        if body:
+            headers['Content-Type'] = 'application/json'
+        url = url['raw'] if isinstance(url, dict) else url
+        found[item['name']] = {
+            'method': request['method'],
+            'path': url.replace('{{baseUrl}}', '', 1),
+            'headers': headers,
+            'body': body,
+        }
+    missing = set(names) - set(found)
+    if missing:
+        raise CommandError(
+            f'Requests not found in {path}: {", ".join(sorted(missing))}.'
+        )
+    return found
+
+
+def render(template, variables, url=False):
+    """Подстановка переменных {{name}}, в адресе - с кодированием."""
+    def replace(match):
+        try:
+            value = str(variables[match.group(1)])
+        except KeyError:
+            raise CommandError(f'Unknown variable {match.group(0)}.')
+        return quote(value, safe='') if url else value
+    return VARIABLE.sub(replace, template)
+
+
+class Stats:
+    """Счётчики и задержки запросов одного названия."""
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = 0
+
+    def add(self, status, latency):
+        self.latencies.append(latency)
+        self.statuses[status] += 1
+        if not 200 <= status < 400:
+            self.errors += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.statuses.update(other.statuses)
+        self.errors += other.errors
+
+    def percentile(self, fraction):
+        """Процентиль по ближайшему рангу, latencies уже отсортированы."""
+        if not self.latencies:
+            return 0
+        return self.latencies[
+            max(0, math.ceil(fraction * len(self.latencies)) - 1)
+        ]
+
+    def histogram(self):
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in self.latencies:
+            counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        labels = [f'<={bound}' for bound in LATENCY_BUCKETS]
+        labels.append(f'>{LATENCY_BUCKETS[-1]}')
+        return dict(zip(labels, counts))
+
+    def summary(self, elapsed):
+        self.latencies.sort()
+        count = len(self.latencies)
+        return {
+            'requests': count,
+            'rps': round(count / elapsed, 1) if elapsed else 0,
+            'error_rate': round(self.errors / count, 4) if count else 0,
+            'p50_ms': round(self.percentile(0.5), 2),
+            'p95_ms': round(self.percentile(0.95), 2),
+            'p99_ms': round(self.percentile(0.99), 2),
+            'statuses': {
+                str(status): number
+                for status, number in sorted(self.statuses.items())
+            },
+            'histogram_ms': self.histogram(),
+        }
+
+
+class VirtualUser(Thread):
+    """
+    Виртуальный пользователь.
+
+    До окончания времени выбирает сценарии по весам и выполняет
+    их запросы подряд через одно keep-alive соединение.
+    Начатый сценарий доводится до конца, чтобы отменить изменения.
+    """
+
+    def __init__(self, url, requests, scenarios, weights, variables,
+                 deadline, think, seed):
+        super().__init__(daemon=True)
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.requests = requests
+        self.scenarios = scenarios
+        self.weights = weights
+        self.variables = variables
+        self.deadline = deadline
+        self.think = think
+        self.rng = Random(seed)
+        self.stats = {}
+        self.connection = None
+
+    def run(self):
+        names = list(self.scenarios)
+        while monotonic() < self.deadline:
+            scenario = self.rng.choices(names, weights=self.weights)[0]
+            variables = self.variables(self.rng)
+            for name in self.scenarios[scenario]:
+                status, latency = self.send(self.requests[name], variables)
+                self.stats.setdefault(name, Stats()).add(status, latency)
+                if self.think:
+                    sleep(self.rng.expovariate(1 / self.think))
+        if self.connection is not None:
+            self.connection.close()
+
+    def send(self, request, variables):
+        """Статус ответа (0 при ошибке соединения) и задержка в мс."""
+        path = self.prefix + render(request['path'], variables, url=True)
+        headers = {
+            key: render(value, variables)
+            for key, value in request['headers'].items()
+        }
+        body = render(request['body'], variables).encode() or None
+        if self.connection is None:
+            self.connection = HTTPConnection(self.host, self.port, timeout=30)
+        started = perf_counter()
+        try:
+            self.connection.request(
+                request['method'], path, body=body, headers=headers
+            )
+            response = self.connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, HTTPException):
+            self.connection.close()
+            self.connection = None
+            status = 0
+        return status, (perf_counter() - started) * 1000
+
+
+def run_load(url, requests, weights, variables, users, duration, think=0,
+             seed=0):
+    """
+    Нагрузка users виртуальными пользователями в течение duration секунд.
+
+    variables(index) возвращает для пользователя функцию, выбирающую
+    значения переменных коллекции для очередного сценария.
+    Возвращает сводку в целом и по каждому запросу.
+    """
+    scenarios = {name: SCENARIOS[name] for name in weights}
+    # Ошибка в шаблоне должна остановить запуск, а не потоки.
+    sample = variables(0)(Random(seed))
+    for request in requests.values():
+        for template in (request['path'], request['body'],
+                         *request['headers'].values()):
+            render(template, sample)
+    started = monotonic()
+    threads = [
+        VirtualUser(
+            url, requests, scenarios, list(weights.values()),
+            variables(index), started + duration, think, seed + index
+        )
+        for index in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = monotonic() - started
+    total, per_request = Stats(), {}
+    for thread in threads:
+        for name, stats in thread.stats.items():
+            per_request.setdefault(name, Stats()).merge(stats)
+            total.merge(stats)
+    return {
+        'elapsed': round(elapsed, 2),
+        'total': total.summary(elapsed),
+        'requests': {
+            name: stats.summary(elapsed)
+            for name, stats in sorted(per_request.items())
+        },
+    }
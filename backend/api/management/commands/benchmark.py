@@ -0,0 +1,404 @@
+"""Benchmark API endpoints and compare results with a stored baseline."""
+import json
+import math
+import re
+from collections import namedtuple
+from itertools import combinations
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Exists, OuterRef
+from django.test.utils import CaptureQueriesContext
+from django.utils import baseconv, timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscribe
+
+User = get_user_model()
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'data' / 'benchmark_baseline.json'
+DEFAULT_REPORT = settings.BASE_DIR / 'benchmark_report.json'
+BULK_RECIPES = 10
+
+# Запрос: метод, путь, тело. Шаблоны путей заполняются из get_params.
+Request = namedtuple('Request', 'method path data', defaults=(None,))
+# Замеряемый запрос, подготовка состояния перед ним и откат после.
+Case = namedtuple(
+    'Case', 'request status anonymous setup teardown',
+    defaults=(200, False, None, None)
+)
+
+RECIPE_FILTERS = (
+    'author={author}',
+    'tags={tag}&tags={other_tag}',
+    'is_favorited=1',
+    'is_in_shopping_cart=1',
+    'search={word}',
+)
+
+
+def get(path, **kwargs):
+    return Case(Request('GET', path), **kwargs)
+
+
+def toggle(path, data=None):
+    """Добавление и удаление, каждое возвращает состояние обратно."""
+    add, remove = Request('POST', path, data), Request('DELETE', path, data)
+    return (
+        Case(add, status=201, teardown=remove),
+        Case(remove, status=204, setup=add),
+    )
+
+
+def build_cases():
+    cases = [
+        get('/api/recipes/?' + '&'.join(filters))
+        for size in range(len(RECIPE_FILTERS) + 1)
+        for filters in combinations(RECIPE_FILTERS, size)
+    ]
+    cases += [
+        get('/api/recipes/?tags={tag}&tags={other_tag}&tags_match=all'),
+        get('/api/recipes/?page=2'),
+        get('/api/recipes/?limit=50'),
+        get('/api/recipes/?cursor='),
+        get('/api/recipes/?', anonymous=True),
+        get('/api/recipes/{recipe}/'),
+        get('/api/recipes/{recipe}/', anonymous=True),
+        get('/api/recipes/{recipe}/get-link/'),
+        get('/s/{short_link}', status=302, anonymous=True),
+        get('/api/recipes/feed/'),
+        *toggle('/api/recipes/{fresh_recipe}/favorite/'),
+        *toggle('/api/recipes/{fresh_recipe}/shopping_cart/'),
+        *toggle('/api/recipes/favorite/bulk/', {'recipes': '{fresh_bulk}'}),
+        *toggle(
+            '/api/recipes/shopping_cart/bulk/', {'recipes': '{fresh_bulk}'}
+        ),
+        get('/api/recipes/download_shopping_cart/'),
+        get('/api/recipes/download_shopping_cart/?format=csv'),
+        get('/api/recipes/download_shopping_cart/?format=json'),
+        get('/api/users/subscriptions/'),
+        get('/api/users/subscriptions/?recipes_limit=3'),
+        get('/api/users/subscriptions/?recipes_limit=3&limit=20'),
+        *toggle('/api/users/{fresh_author}/subscribe/'),
+        get('/api/users/'),
+        get('/api/users/?limit=50'),
+        get('/api/users/', anonymous=True),
+        get('/api/users/{author}/'),
+        get('/api/users/me/'),
+        get('/api/tags/'),
+        get('/api/tags/{tag_id}/'),
+        get('/api/ingredients/'),
+        get('/api/ingredients/?name={prefix}'),
+        get('/api/ingredients/?name={letter}'),
+        get('/api/ingredients/{ingredient}/'),
+    ]
+    return {case_name(case): case for case in cases}
+
+
+def case_name(case):
+    name = f'{case.request.method} {case.request.path}'.rstrip('?')
+    return f'{name} (anonymous)' if case.anonymous else name
+
+
+def percentile(values, fraction):
+    """Процентиль по ближайшему рангу."""
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def count_rows(response, body):
+    """Количество объектов в ответе: элементов списка или строк файла."""
+    if not body:
+        return 0
+    content_type = response.get('Content-Type', '')
+    if 'json' in content_type:
+        data = json.loads(body)
+        if isinstance(data, dict):
+            data = data.get('results', [data])
+        return len(data)
+    lines = body.decode().splitlines()
+    return len(lines) - 1 if 'csv' in content_type else len(lines)
+
+
+class Command(BaseCommand):
+    """Command for measuring latency and query counts of API endpoints."""
+
+    help = (
+        'Drive every API endpoint through the test client against the '
+        'current database, record p50/p95 latency, query count and rows '
+        'returned, write a JSON report and compare it with the baseline '
+        'of the same database vendor. Query counts and rows are compared '
+        'only on the dataset of the baseline: the committed SQLite baseline '
+        'was recorded with DB_ENGINE=sqlite after "import '
+        'ingredient=data/ingredients.csv tag=data/tags.json" and "seed '
+        '--scale 1 --seed 0" on an empty database. Latency depends on the '
+        'machine and is compared only with --check-latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of measured requests per endpoint.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Number of requests per endpoint made before measuring.'
+        )
+        parser.add_argument(
+            '--only', default='',
+            help='Run only endpoints whose name contains this text.'
+        )
+        parser.add_argument(
+            '--output', default=str(DEFAULT_REPORT),
+            help='Path to the JSON report.'
+        )
+        parser.add_argument(
+            '--baseline', default=str(DEFAULT_BASELINE),
+            help='Path to the JSON file with baselines per database vendor.'
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Write current results to the baseline of this vendor.'
+        )
+        parser.add_argument(
+            '--check-latency', action='store_true',
+            help=(
+                'Also fail on median latency growth. Use with a baseline '
+                'recorded on the same machine, e.g. --update-baseline '
+                '--baseline local_baseline.json.'
+            )
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help=(
+                'Allowed relative growth of median latency, p95 of a few '
+                'requests is too noisy to fail on.'
+            )
+        )
+        parser.add_argument(
+            '--min-delta', type=float, default=5,
+            help='Ignore latency growth below this many milliseconds.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        user = self.get_user()
+        params = self.get_params(user)
+        clients = {
+            False: self.get_client(user),
+            True: self.get_client(None),
+        }
+        results = {}
+        for name, case in build_cases().items():
+            if options['only'] not in name:
+                continue
+            results[name] = self.measure(
+                name, case, clients[case.anonymous], params,
+                options['warmup'], options['repeat']
+            )
+            self.stdout.write(
+                '{p50_ms:8.1f} {p95_ms:8.1f} {queries:4} {rows:6}  '
+                .format(**results[name]) + name
+            )
+        report = {
+            'vendor': connection.vendor,
+            'created': timezone.now().isoformat(),
+            'repeat': options['repeat'],
+            'dataset': self.get_dataset(),
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(
+            f'Measured {len(results)} endpoints, report written to '
+            f'{options["output"]}.'
+        )
+        if options['update_baseline']:
+            self.update_baseline(report, options['baseline'])
+            return
+        problems = self.compare(report, options)
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
+
+    def get_user(self):
+        """Пользователь с избранным, корзиной и подписками."""
+        user = User.objects.filter(
+            Exists(Favorite.objects.filter(user=OuterRef('pk'))),
+            Exists(ShoppingCart.objects.filter(user=OuterRef('pk'))),
+            Exists(Subscribe.objects.filter(user=OuterRef('pk'))),
+        ).order_by('pk').first()
+        if user is None:
+            raise CommandError(
+                'Database needs a user with favorites, a shopping cart and '
+                'subscriptions, run manage.py seed first.'
+            )
+        return user
+
+    def get_client(self, user):
+        client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def get_params(self, user):
+        recipe = Recipe.objects.order_by('-pub_date', '-pk').first()
+        tags = list(Tag.objects.order_by('pk')[:2])
+        ingredient = Ingredient.objects.order_by('pk').first()
+        fresh_recipes = list(
+            Recipe.objects.exclude(favorites__user=user)
+            .exclude(shopping_cart__user=user)
+            .order_by('pk').values_list('pk', flat=True)[:BULK_RECIPES]
+        )
+        fresh_author = (
+            User.objects.exclude(pk=user.pk)
+            .exclude(subscriptions__user=user)
+            .filter(recipes_count__gt=0).order_by('pk').first()
+        )
+        if not (recipe and tags and ingredient and fresh_recipes
+                and fresh_author):
+            raise CommandError(
+                'Database needs recipes, tags, ingredients and authors '
+                'the benchmark user is not subscribed to.'
+            )
+        words = re.findall(r'\w+', recipe.name)
+        return {
+            'recipe': recipe.pk,
+            'short_link': baseconv.base64.encode(recipe.pk),
+            'author': recipe.author_id,
+            'tag': tags[0].slug,
+            'other_tag': tags[-1].slug,
+            'tag_id': tags[0].pk,
+            'word': words[0] if words else recipe.name,
+            'ingredient': ingredient.pk,
+            'prefix': ingredient.name[:2],
+            'letter': ingredient.name[:1],
+            'fresh_recipe': fresh_recipes[0],
+            'fresh_bulk': fresh_recipes,
+            'fresh_author': fresh_author.pk,
+        }
+
+    def get_dataset(self):
+        return {
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'favorites': Favorite.objects.count(),
+            'subscriptions': Subscribe.objects.count(),
+        }
+
+    def send(self, client, request, params):
+        data = request.data and {
+            key: params[value[1:-1]] if value.startswith('{') else value
+            for key, value in request.data.items()
+        }
+        return client.generic(
+            request.method, request.path.format(**params),
+            json.dumps(data) if data else '',
+            content_type='application/json'
+        )
+
+    def measure(self, name, case, client, params, warmup, repeat):
+        timings, queries = [], 0
+        for attempt in range(warmup + repeat):
+            if case.setup:
+                self.send(client, case.setup, params)
+            # Журнал запросов ограничен по длине, а запросы контекста
+            # читаются из него срезом: очищаем его перед каждым замером.
+            reset_queries()
+            with CaptureQueriesContext(connection) as context:
+                started = perf_counter()
+                response = self.send(client, case.request, params)
+                body = (
+                    b''.join(response.streaming_content)
+                    if response.streaming else response.content
+                )
+                elapsed = perf_counter() - started
+            count = len(context.captured_queries)
+            if case.teardown:
+                self.send(client, case.teardown, params)
+            if response.status_code != case.status:
+                raise CommandError(
+                    f'{name} returned {response.status_code}, expected '
+                    f'{case.status}: {body[:200]!r}'
+                )
+            if attempt >= warmup:
+                timings.append(elapsed * 1000)
+                queries = max(queries, count)
+        return {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': queries,
+            'rows': count_rows(response, body),
+        }
+
+    def load_baselines(self, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def update_baseline(self, report, path):
+        baselines = self.load_baselines(path)
+        baselines[report['vendor']] = report
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(baselines, file, ensure_ascii=False, indent=2)
+        self.stdout.write(
+            f'{report["vendor"]} baseline written to {path}.'
+        )
+
+    def compare(self, report, options):
+        """
+        Сравнение с базовой линией той же СУБД.
+
+        Число запросов и строк сравнивается, только если набор данных
+        совпадает с базовым: на другом наборе страница может оказаться
+        пустой и обойтись без части запросов. Медианная задержка
+        сравнивается только с --check-latency.
+        """
+        baseline = self.load_baselines(options['baseline']).get(
+            report['vendor']
+        )
+        if baseline is None:
+            self.stdout.write(
+                f'No {report["vendor"]} baseline at {options["baseline"]}, '
+                'run with --update-baseline.'
+            )
+            return []
+        if baseline['dataset'] != report['dataset']:
+            self.stdout.write(
+                f'Dataset {report["dataset"]} differs from the baseline '
+                f'{baseline["dataset"]}, nothing is compared.'
+            )
+            return []
+        problems = []
+        for name, result in report['results'].items():
+            expected = baseline['results'].get(name)
+            if expected is None:
+                self.stdout.write(f'{name}: not in the baseline.')
+                continue
+            if result['queries'] > expected['queries']:
+                problems.append(
+                    f'{name}: {result["queries"]} queries, baseline '
+                    f'{expected["queries"]}'
+                )
+            if result['rows'] != expected['rows']:
+                problems.append(
+                    f'{name}: {result["rows"]} rows, baseline '
+                    f'{expected["rows"]}'
+                )
+            growth = result['p50_ms'] - expected['p50_ms']
+            if options['check_latency'] and growth > max(
+                options['min_delta'], expected['p50_ms'] * options['tolerance']
+            ):
+                problems.append(
+                    f'{name}: p50 {result["p50_ms"]} ms, baseline '
+                    f'{expected["p50_ms"]} ms'
+                )
+        return problems
@@ -0,0 +1,43 @@
+"""Build resized copies of recipe images and avatars."""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from foodgram.images import build_variants
+from recipes.constants import RECIPE_IMAGE_VARIANTS
+from recipes.models import Recipe
+from users.constants import AVATAR_IMAGE_VARIANTS
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Command for filling image variants of existing objects."""
+
+    help = (
+        'Build missing image variants of recipes and user avatars, '
+        'for example after changing variant sizes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild variants that already exist.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        targets = (
+            (Recipe, 'image', 'image_variants', RECIPE_IMAGE_VARIANTS),
+            (User, 'avatar', 'avatar_variants', AVATAR_IMAGE_VARIANTS),
+        )
+        for model, image_field, variants_field, sizes in targets:
+            queryset = model.objects.exclude(**{image_field: ''})
+            if options['force']:
+                queryset.update(**{variants_field: {}})
+            built = sum(
+                build_variants(model, pk, image_field, variants_field, sizes)
+                for pk in queryset.values_list('pk', flat=True).iterator()
+            )
+            self.stdout.write(
+                f'{model._meta.label}: built variants for {built} objects.'
+            )
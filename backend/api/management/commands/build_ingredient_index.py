@@ -0,0 +1,32 @@
+"""Build the ingredient autocomplete index."""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.ingredient_index import build_ingredient_index
+from recipes.models import CatalogVersion
+
+
+class Command(BaseCommand):
+    """Command for rebuilding the ingredient prefix index file."""
+
+    help = (
+        'Build the ingredient autocomplete index and bump the ingredients '
+        'catalog version, so stale cached responses are not served.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-ranking', action='store_true',
+            help='Do not rank results by usage in recipes.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        count = build_ingredient_index(
+            rank_by_usage=not options['no_ranking']
+        )
+        # Cached search responses were built from the previous index.
+        CatalogVersion.bump(CatalogVersion.INGREDIENTS)
+        self.stdout.write(
+            f'Built {settings.INGREDIENT_INDEX_PATH}: {count} entries.'
+        )
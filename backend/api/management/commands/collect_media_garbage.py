@@ -0,0 +1,85 @@
+"""Delete media files that are no longer referenced."""
+import os
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodgram.constants import MEDIA_GC_MIN_AGE
+from recipes.models import Recipe
+
+User = get_user_model()
+
+# Модель, поле файла и поле с копиями изображения.
+MEDIA_FIELDS = (
+    (Recipe, 'image', 'image_variants'),
+    (User, 'avatar', 'avatar_variants'),
+)
+
+
+def walk(storage, directory):
+    """Имена всех файлов каталога хранилища и его подкаталогов."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield os.path.join(directory, name)
+    for name in directories:
+        yield from walk(storage, os.path.join(directory, name))
+
+
+class Command(BaseCommand):
+    """Command for removing orphaned recipe images and avatars."""
+
+    help = (
+        'Walk the recipe image and avatar directories and delete files '
+        'not referenced by any recipe or user.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=MEDIA_GC_MIN_AGE,
+            help=(
+                'Keep files younger than this many seconds: they may belong '
+                'to uploads that are not committed yet.'
+            )
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report files that would be deleted.'
+        )
+
+    def referenced_names(self):
+        names = set()
+        for model, file_field, variants_field in MEDIA_FIELDS:
+            rows = model.objects.values_list(file_field, variants_field)
+            for name, variants in rows.iterator():
+                if name:
+                    names.add(name)
+                names.update((variants or {}).values())
+        return names
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        storage = default_storage
+        referenced = self.referenced_names()
+        cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        deleted = size = 0
+        for model, file_field, _ in MEDIA_FIELDS:
+            root = model._meta.get_field(file_field).upload_to
+            for name in walk(storage, root.rstrip('/')):
+                if (
+                    name in referenced
+                    or storage.get_modified_time(name) > cutoff
+                ):
+                    continue
+                size += storage.size(name)
+                deleted += 1
+                if not options['dry_run']:
+                    storage.delete(name)
+        self.stdout.write(
+            f'{"Would delete" if options["dry_run"] else "Deleted"} '
+            f'{deleted} files, {size} bytes.'
+        )
@@ -0,0 +1,205 @@
+"""Explain hot API queries and compare plans with a stored baseline."""
+import json
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'data' / 'query_plans.json'
+
+HOT_ENDPOINTS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/recipes/?cursor=',
+    '/api/recipes/?author={author}',
+    '/api/recipes/?tags={tag}',
+    '/api/recipes/?tags={tag}&tags={other_tag}',
+    '/api/recipes/?tags={tag}&tags={other_tag}&tags_match=all',
+    '/api/recipes/?is_favorited=1',
+    '/api/recipes/?is_in_shopping_cart=1',
+    '/api/recipes/?tags={tag}&is_favorited=1',
+    '/api/recipes/?search={word}',
+    '/api/recipes/{recipe}/',
+    '/api/recipes/download_shopping_cart/',
+    '/api/recipes/feed/',
+    '/api/tags/',
+    '/api/ingredients/?name={prefix}',
+    '/api/users/',
+    '/api/users/me/',
+    '/api/users/subscriptions/?recipes_limit=3',
+)
+
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+
+class Command(BaseCommand):
+    """Command for checking query plans of the hot API endpoints."""
+
+    help = (
+        'Run EXPLAIN for every SELECT issued by the hot API endpoints, '
+        'flag sequential scans and compare plans with a stored baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline', default=str(DEFAULT_BASELINE),
+            help='Path to the JSON file with baseline plans.'
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Write current plans to the baseline file.'
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='Ignore sequential scans of tables with fewer rows.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        plans = self.collect_plans()
+        tables = set(connection.introspection.table_names())
+        problems = []
+        for endpoint, queries in plans.items():
+            for query in queries:
+                for table in query['seq_scans']:
+                    if (table in tables and self.table_rows(table)
+                            >= options['min_rows']):
+                        problems.append(
+                            f'{endpoint}: sequential scan on {table}\n'
+                            f'    {query["sql"]}'
+                        )
+        if options['update_baseline']:
+            with open(options['baseline'], 'w', encoding='utf-8') as file:
+                json.dump(plans, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Baseline written to {options["baseline"]}.')
+        else:
+            problems.extend(self.compare(plans, options['baseline']))
+        total = sum(len(queries) for queries in plans.values())
+        self.stdout.write(
+            f'Explained {total} queries from {len(plans)} endpoints.'
+        )
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Query plans are fine.'))
+
+    def get_client(self):
+        client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        user = User.objects.filter(
+            favorites__isnull=False).first() or User.objects.first()
+        if user is None:
+            raise CommandError('Database has no users to run queries as.')
+        client.force_authenticate(user)
+        return client
+
+    def get_params(self):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        ingredient = Ingredient.objects.first()
+        if recipe is None or not tags or ingredient is None:
+            raise CommandError(
+                'Database needs at least one recipe, tag and ingredient.'
+            )
+        return {
+            'recipe': recipe.pk,
+            'author': recipe.author_id,
+            'tag': tags[0],
+            'other_tag': tags[-1],
+            'word': recipe.name.split()[0],
+            'prefix': ingredient.name[:2],
+        }
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'
+    }})
+    def collect_plans(self):
+        client = self.get_client()
+        params = self.get_params()
+        plans = {}
+        for template in HOT_ENDPOINTS:
+            endpoint = template.format(**params)
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(endpoint)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{endpoint} returned {response.status_code}.'
+                )
+            plans[template] = [
+                self.explain(query['sql'])
+                for query in context.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT')
+            ]
+        return plans
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                nodes = list(self.walk_postgresql(cursor.fetchone()[0][0]))
+                seq_scans = [
+                    node['Relation Name'] for node in nodes
+                    if node['Node Type'] == 'Seq Scan'
+                ]
+                plan = [
+                    ' '.join(filter(None, (
+                        node['Node Type'],
+                        node.get('Relation Name'),
+                        node.get('Index Name'),
+                    ))) for node in nodes
+                ]
+            else:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+                seq_scans = [
+                    match.group(1) for match in map(
+                        SQLITE_FULL_SCAN.match, plan) if match
+                ]
+        return {'sql': sql[:200], 'plan': plan, 'seq_scans': seq_scans}
+
+    def walk_postgresql(self, node):
+        node = node.get('Plan', node)
+        yield node
+        for child in node.get('Plans', ()):
+            yield from self.walk_postgresql(child)
+
+    def table_rows(self, table):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [table]
+                )
+                row = cursor.fetchone()
+                return row[0] if row else 0
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+            )
+            return cursor.fetchone()[0]
+
+    def compare(self, plans, path):
+        try:
+            with open(path, encoding='utf-8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            self.stdout.write(
+                f'No baseline at {path}, run with --update-baseline.'
+            )
+            return []
+        problems = []
+        for endpoint, queries in plans.items():
+            expected = [query['plan'] for query in baseline.get(endpoint, [])]
+            actual = [query['plan'] for query in queries]
+            if expected != actual:
+                problems.append(
+                    f'{endpoint}: plan changed\n'
+                    f'    baseline: {json.dumps(expected, ensure_ascii=False)}'
+                    f'\n    current:  {json.dumps(actual, ensure_ascii=False)}'
+                )
+        return problems
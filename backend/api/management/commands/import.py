@@ -1,33 +1,72 @@
-"""Import csv files to database."""
-import csv
+"""Import catalog data and fixtures to database."""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
 
-from django.core.management.base import BaseCommand
+from api.constants import IMPORT_BATCH_SIZE
 
-from recipes.models import Ingredient
-
-data_files = {
-    'ingredient': 'data/ingredients.csv',
-}
+DEFAULT_FILES = ('ingredient=data/ingredients.csv',)
 
 
 class Command(BaseCommand):
-    """Command for import csv into database."""
+    """Command for batched, idempotent import of CSV and JSON files."""
+
+    help = (
+        'Import CSV, JSON or JSON Lines files to database. Rows are matched '
+        'by natural key, so importing the same file again changes nothing.'
+    )
 
-    help = 'Import csv files to database.'
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files', nargs='*', metavar='model=path',
+            help=(
+                'Files to import in order, model is one of the IMPORTERS '
+                f'setting keys. Default: {" ".join(DEFAULT_FILES)}.'
+            )
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Number of rows written by one set of queries.'
+        )
+        parser.add_argument(
+            '--method', choices=('auto', 'orm', 'copy'), default='auto',
+            help=(
+                'copy merges batches through COPY into a staging table, '
+                'available on PostgreSQL for models with a unique key; '
+                'auto uses it where possible.'
+            )
+        )
 
     def handle(self, *args, **options):
         """Handle function."""
-        for model, file_path in data_files.items():
-            print(f'Importing {file_path} to {model}...')
-            with open(file_path, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    obj = self.create_object(model, row)
-                    if obj:
-                        obj.save()
-            print(f'Success import {file_path}.')
-
-    def create_object(self, model_name, data):
-        """Create object from django ORM."""
-        if model_name == 'ingredient':
-            return Ingredient(**data)
+        imports = []
+        for item in options['files'] or DEFAULT_FILES:
+            model, _, path = item.partition('=')
+            if model not in settings.IMPORTERS or not path:
+                raise CommandError(
+                    f'Wrong file {item}, expected model=path with model one '
+                    f'of: {", ".join(settings.IMPORTERS)}.'
+                )
+            imports.append((model, import_string(
+                settings.IMPORTERS[model]
+            )(path)))
+        for model, importer in imports:
+            use_copy = options['method'] != 'orm' and importer.can_copy()
+            if options['method'] == 'copy' and not use_copy:
+                raise CommandError(f'COPY is not available for {model}.')
+            self.stdout.write(f'Importing {importer.path} to {model}...')
+            elapsed = importer.run(
+                options['batch_size'], use_copy, self.report
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Imported {importer.path}: {importer.processed} rows, '
+                f'{importer.created} created, {importer.updated} updated '
+                f'in {elapsed:.1f}s.'
+            ))
+
+    def report(self, importer, elapsed):
+        rate = importer.processed / elapsed if elapsed else 0
+        self.stdout.write(
+            f'  {importer.processed} rows, {importer.created} created, '
+            f'{importer.updated} updated, {rate:.0f} rows/s'
+        )
@@ -0,0 +1,343 @@
+"""Replay Postman collection scenarios against gunicorn under load."""
+import json
+import shlex
+import socket
+import subprocess
+import sys
+from contextlib import contextmanager
+from http.client import HTTPConnection
+from random import Random
+from time import monotonic, sleep
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.load_replay import (DEFAULT_WEIGHTS, SCENARIOS, load_collection,
+                             run_load)
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from users.models import Subscribe
+
+User = get_user_model()
+
+DEFAULT_COLLECTION = (
+    settings.BASE_DIR.parent / 'postman_collection'
+    / 'foodgram.postman_collection.json'
+)
+DEFAULT_REPORT = settings.BASE_DIR / 'load_report.json'
+DOCKERFILE = settings.BASE_DIR / 'Dockerfile'
+# Рецептов в пуле каждого виртуального пользователя.
+RECIPE_POOL_SIZE = 200
+
+
+def dockerfile_command():
+    """Аргументы gunicorn из CMD Dockerfile без адреса привязки."""
+    for line in reversed(DOCKERFILE.read_text().splitlines()):
+        if line.startswith('CMD '):
+            command = json.loads(line[len('CMD '):])
+            break
+    else:
+        raise CommandError(f'No CMD in {DOCKERFILE}.')
+    if command[0] != 'gunicorn':
+        raise CommandError(f'CMD in {DOCKERFILE} does not run gunicorn.')
+    args, skip = [], False
+    for arg in command[1:]:
+        if skip:
+            skip = False
+        elif arg in ('-b', '--bind'):
+            skip = True
+        elif not arg.startswith('--bind='):
+            args.append(arg)
+    return args
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    """Command for load testing gunicorn with Postman collection requests."""
+
+    help = (
+        'Run weighted scenarios built from the Postman collection requests '
+        '(browse, filter, favorite, cart, download, subscribe) with '
+        'concurrent virtual users, each logged in as its own seeded user. '
+        'Starts gunicorn with the Dockerfile CMD and every --gunicorn '
+        'option set in turn, or uses a running server given by --url, '
+        'and reports throughput, error rate and latency per request.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collection', default=str(DEFAULT_COLLECTION),
+            help='Path to the Postman collection.'
+        )
+        parser.add_argument(
+            '--url',
+            help='Address of a running server, gunicorn is not started.'
+        )
+        parser.add_argument(
+            '--gunicorn', action='append', default=[], metavar='OPTIONS',
+            help=(
+                'gunicorn options to compare with the Dockerfile CMD, e.g. '
+                '"--workers 4" or "--workers 2 --worker-class gthread '
+                '--threads 4". May be repeated.'
+            )
+        )
+        parser.add_argument(
+            '--users', type=int, default=20,
+            help='Number of concurrent virtual users.'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=30,
+            help='Seconds of load for every server configuration.'
+        )
+        parser.add_argument(
+            '--think', type=float, default=0,
+            help='Mean pause in seconds between requests of a user.'
+        )
+        parser.add_argument(
+            '--scenario', action='append', default=[],
+            metavar='NAME=WEIGHT',
+            help=(
+                'Scenario weight, 0 disables the scenario. Defaults: '
+                + ', '.join(
+                    f'{name}={weight}'
+                    for name, weight in DEFAULT_WEIGHTS.items()
+                ) + '.'
+            )
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed of scenario and variable choice.'
+        )
+        parser.add_argument(
+            '--startup-timeout', type=float, default=30,
+            help='Seconds to wait for gunicorn to accept requests.'
+        )
+        parser.add_argument(
+            '--histograms', action='store_true',
+            help='Print latency histograms of every request.'
+        )
+        parser.add_argument(
+            '--output', default=str(DEFAULT_REPORT),
+            help='Path to the JSON report.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        weights = self.get_weights(options['scenario'])
+        requests = load_collection(options['collection'], {
+            name for scenario in weights for name in SCENARIOS[scenario]
+        })
+        variables = self.bind_variables(options['users'], options['seed'])
+        if options['url']:
+            configs = [(options['url'], None)]
+        else:
+            base = dockerfile_command()
+            commands = [base] + [
+                shlex.split(extra) + base for extra in options['gunicorn']
+            ]
+            configs = [
+                ('gunicorn ' + ' '.join(command), command)
+                for command in commands
+            ]
+        results = {}
+        for label, command in configs:
+            with self.server(command, options) as url:
+                self.stdout.write(
+                    f'{label}: {options["users"]} users for '
+                    f'{options["duration"]:g}s...'
+                )
+                results[label] = run_load(
+                    url, requests, weights, variables, options['users'],
+                    options['duration'], options['think'], options['seed']
+                )
+            self.write_result(results[label], options['histograms'])
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump({
+                'users': options['users'],
+                'duration': options['duration'],
+                'weights': weights,
+                'results': results,
+            }, file, ensure_ascii=False, indent=2)
+        self.write_comparison(results)
+        self.stdout.write(f'Report written to {options["output"]}.')
+
+    def get_weights(self, items):
+        weights = dict(DEFAULT_WEIGHTS)
+        for item in items:
+            name, _, weight = item.partition('=')
+            if name not in SCENARIOS:
+                raise CommandError(
+                    f'Unknown scenario {name}, expected one of: '
+                    f'{", ".join(SCENARIOS)}.'
+                )
+            try:
+                weights[name] = float(weight)
+            except ValueError:
+                raise CommandError(f'Wrong weight in {item}.')
+        weights = {name: weight for name, weight in weights.items() if weight}
+        if not weights:
+            raise CommandError('All scenarios are disabled.')
+        return weights
+
+    def bind_variables(self, users, seed):
+        """
+        Переменные коллекции для каждого виртуального пользователя.
+
+        У каждого свой пользователь с токеном, рецепты не из его
+        избранного и корзины и авторы, на которых он не подписан,
+        поэтому сценарии разных пользователей не мешают друг другу.
+        """
+        accounts = list(
+            User.objects.filter(is_active=True, is_superuser=False)
+            .order_by('pk')[:users]
+        )
+        tags = list(Tag.objects.order_by('pk').values_list('pk', 'slug'))
+        ingredients = list(Ingredient.objects.values_list('pk', 'name'))
+        authors = list(
+            User.objects.filter(recipes_count__gt=0)
+            .values_list('pk', flat=True)
+        )
+        recipes = list(Recipe.objects.values_list('pk', flat=True))
+        if len(accounts) < users or not (tags and ingredients and recipes):
+            raise CommandError(
+                f'Database needs {users} users, tags, ingredients and '
+                'recipes, run manage.py seed first.'
+            )
+        rng = Random(seed)
+        bound = []
+        for account in accounts:
+            token, _ = Token.objects.get_or_create(user=account)
+            taken = set(
+                Favorite.objects.filter(user=account)
+                .values_list('recipes_id', flat=True)
+            ) | set(
+                ShoppingCart.objects.filter(user=account)
+                .values_list('recipes_id', flat=True)
+            )
+            followed = set(
+                Subscribe.objects.filter(user=account)
+                .values_list('subscriptions_id', flat=True)
+            )
+            fresh_recipes = [pk for pk in recipes if pk not in taken]
+            fresh_authors = [
+                pk for pk in authors
+                if pk not in followed and pk != account.pk
+            ]
+            if not fresh_recipes or not fresh_authors:
+                raise CommandError(
+                    f'User {account.pk} has every recipe in favorites or '
+                    'cart or follows every author.'
+                )
+            bound.append({
+                'token': token.key,
+                'recipes': rng.sample(
+                    fresh_recipes, min(RECIPE_POOL_SIZE, len(fresh_recipes))
+                ),
+                'authors': fresh_authors,
+            })
+
+        def variables(index):
+            account = bound[index]
+
+            def choose(rng):
+                ingredient_id, ingredient_name = rng.choice(ingredients)
+                return {
+                    'userToken': account['token'],
+                    'userId': rng.choice(authors),
+                    'thirdUserId': rng.choice(account['authors']),
+                    'firstRecipeId': rng.choice(account['recipes']),
+                    'firstTagId': tags[0][0],
+                    'secondTagSlug': tags[1 % len(tags)][1],
+                    'thirdTagSlug': tags[2 % len(tags)][1],
+                    'firstIndredientId': ingredient_id,
+                    'ingredientNameFirstLatter': ingredient_name[:1],
+                }
+            return choose
+        return variables
+
+    @contextmanager
+    def server(self, command, options):
+        """Запущенный gunicorn с командой command или адрес из --url."""
+        if command is None:
+            yield options['url']
+            return
+        port = free_port()
+        log = None if options['verbosity'] > 1 else subprocess.DEVNULL
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn',
+             '--bind', f'127.0.0.1:{port}', *command],
+            cwd=settings.BASE_DIR, stdout=log, stderr=log
+        )
+        try:
+            self.wait_for(process, port, options['startup_timeout'])
+            yield f'http://127.0.0.1:{port}'
+        finally:
+            process.terminate()
+            process.wait()
+
+    def wait_for(self, process, port, timeout):
+        deadline = monotonic() + timeout
+        while monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(
+                    f'gunicorn exited with code {process.returncode}, '
+                    'run with --verbosity 2 to see its log.'
+                )
+            connection = HTTPConnection('127.0.0.1', port, timeout=5)
+            try:
+                connection.request('GET', '/api/tags/')
+                connection.getresponse().read()
+                return
+            except OSError:
+                sleep(0.2)
+            finally:
+                connection.close()
+        raise CommandError(f'gunicorn did not start in {timeout:g}s.')
+
+    def write_result(self, result, histograms):
+        self.stdout.write(
+            f'{"requests":>9} {"rps":>8} {"errors":>7} {"p50":>8} '
+            f'{"p95":>8} {"p99":>8}  request'
+        )
+        rows = list(result['requests'].items()) + [('total', result['total'])]
+        for name, stats in rows:
+            self.stdout.write(
+                '{requests:9} {rps:8.1f} {error_rate:7.2%} {p50_ms:8.1f} '
+                '{p95_ms:8.1f} {p99_ms:8.1f}  '.format(**stats) + name
+            )
+            if histograms:
+                self.stdout.write('    ' + ' '.join(
+                    f'{bucket}:{count}'
+                    for bucket, count in stats['histogram_ms'].items()
+                    if count
+                ))
+            errors = {
+                status: count for status, count in stats['statuses'].items()
+                if not 200 <= int(status) < 400
+            }
+            if errors:
+                self.stdout.write(self.style.WARNING(
+                    '    errors: ' + ', '.join(
+                        f'{status}: {count}'
+                        for status, count in errors.items()
+                    )
+                ))
+
+    def write_comparison(self, results):
+        if len(results) < 2:
+            return
+        self.stdout.write(
+            f'{"rps":>8} {"errors":>7} {"p50":>8} {"p95":>8} {"p99":>8}  '
+            'server'
+        )
+        for label, result in results.items():
+            self.stdout.write(
+                '{rps:8.1f} {error_rate:7.2%} {p50_ms:8.1f} {p95_ms:8.1f} '
+                '{p99_ms:8.1f}  '.format(**result['total']) + label
+            )
@@ -0,0 +1,64 @@
+"""Rebuild shopping list aggregates from shopping carts."""
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from django.db.transaction import atomic
+
+from recipes.models import IngredientInRecipe, ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Command for reconciling ShoppingListItem with ShoppingCart."""
+
+    help = 'Rebuild per-user shopping list aggregates from shopping carts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='+', dest='user_ids',
+            help='Rebuild only the lists of these user ids.'
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report rows that differ from the carts.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        user_ids = options['user_ids']
+        if options['check']:
+            drift = self.drift(user_ids)
+            if drift:
+                raise CommandError(
+                    f'{drift} shopping list rows differ from the carts.'
+                )
+            self.stdout.write(self.style.SUCCESS('Shopping lists are fine.'))
+            return
+        with atomic():
+            count = ShoppingListItem.rebuild(user_ids)
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt {count} shopping list rows.')
+        )
+
+    def drift(self, user_ids):
+        items = ShoppingListItem.objects.all()
+        carts = {'recipe__shopping_cart__isnull': False}
+        if user_ids:
+            items = items.filter(user_id__in=user_ids)
+            carts = {'recipe__shopping_cart__user_id__in': user_ids}
+        ingredients = IngredientInRecipe.objects.filter(**carts)
+        rows = ingredients.values_list(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=Sum('amount'), count=Count('id')).order_by()
+        expected = {
+            (user_id, ingredient_id): (total, count)
+            for user_id, ingredient_id, total, count in rows
+        }
+        actual = {
+            (user_id, ingredient_id): (amount, count)
+            for user_id, ingredient_id, amount, count in items.values_list(
+                'user_id', 'ingredient_id', 'amount', 'recipes_count'
+            )
+        }
+        return sum(
+            expected.get(key) != actual.get(key)
+            for key in expected.keys() | actual.keys()
+        )
@@ -0,0 +1,69 @@
+"""Reconcile denormalized counters with the rows they count."""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import F, Max, Q
+
+from foodgram.counters import count_of
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Command for fixing drift in recipe and user counters."""
+
+    help = (
+        'Recount favorites_count and cart_count of recipes, recipes_count '
+        'and followers_count of users in primary key chunks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of rows checked by one query.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report rows with wrong counters.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        counters = (
+            (Recipe, {
+                'favorites_count': count_of(Favorite, 'recipes'),
+                'cart_count': count_of(ShoppingCart, 'recipes'),
+            }),
+            (User, {
+                'recipes_count': count_of(Recipe, 'author'),
+                'followers_count': count_of(Subscribe, 'subscriptions'),
+            }),
+        )
+        for model, expressions in counters:
+            fixed = self.reconcile(
+                model, expressions, options['chunk_size'], options['dry_run']
+            )
+            self.stdout.write(
+                f'{model._meta.label}: {fixed} rows '
+                f'{"to fix" if options["dry_run"] else "fixed"}.'
+            )
+
+    def reconcile(self, model, expressions, chunk_size, dry_run):
+        last_pk = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        drift = Q()
+        for field in expressions:
+            drift |= ~Q(**{field: F(f'actual_{field}')})
+        fixed = 0
+        for start in range(0, last_pk + 1, chunk_size):
+            chunk = model.objects.filter(
+                pk__gte=start, pk__lt=start + chunk_size
+            )
+            pks = list(chunk.annotate(**{
+                f'actual_{field}': expression
+                for field, expression in expressions.items()
+            }).filter(drift).values_list('pk', flat=True))
+            if pks and not dry_run:
+                model.objects.filter(pk__in=pks).update(**expressions)
+            fixed += len(pks)
+        return fixed
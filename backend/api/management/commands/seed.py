@@ -0,0 +1,342 @@
+"""Generate a synthetic dataset for load and scale testing."""
+import random
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from itertools import accumulate, islice
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from api.importer import copy_value
+from api.ingredient_index import schedule_ingredient_index_rebuild
+from foodgram.counters import count_of
+from foodgram.images import save_variants
+from recipes.constants import MAX_LENGTH_FOR_NAME, RECIPE_IMAGE_VARIANTS
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag,
+                            TimelineEntry)
+from users.models import Subscribe
+
+User = get_user_model()
+
+# Rows per unit of --scale.
+USERS_PER_SCALE = 1000
+RECIPES_PER_SCALE = 10000
+
+START_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+PERIOD_SECONDS = 365 * 24 * 60 * 60
+DISHES = ('Суп', 'Салат', 'Пирог', 'Рагу', 'Запеканка', 'Каша', 'Соус')
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей')
+LAST_NAMES = ('Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова')
+
+
+class Sampler:
+    """Random choice of items with power-law (Zipf) popularity."""
+
+    def __init__(self, rng, items, skew):
+        self.rng = rng
+        self.items = list(items)
+        # Popularity must not follow primary key order.
+        rng.shuffle(self.items)
+        self.weights = list(accumulate(
+            1 / rank ** skew for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choices(self, count):
+        """count items with repetition, popular items are chosen more often."""
+        return self.rng.choices(self.items, cum_weights=self.weights, k=count)
+
+    def sample(self, count, exclude=None):
+        """Up to count distinct items."""
+        chosen = dict.fromkeys(self.choices(count))
+        chosen.pop(exclude, None)
+        return list(chosen)
+
+
+class Command(BaseCommand):
+    """Command for generating users, recipes and their relations."""
+
+    help = (
+        'Generate a deterministic synthetic dataset: users, recipes with '
+        'ingredients and tags, favorites, shopping carts and subscriptions '
+        'with power-law popularity. Rows are added to existing data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=float, default=1,
+            help=(
+                f'Scale factor: {USERS_PER_SCALE} users and '
+                f'{RECIPES_PER_SCALE} recipes per unit.'
+            )
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, the same seed gives the same dataset.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent of author, recipe and ingredient popularity.'
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Mean number of favorite recipes per user.'
+        )
+        parser.add_argument(
+            '--cart', type=float, default=3,
+            help='Mean number of recipes in a shopping cart.'
+        )
+        parser.add_argument(
+            '--follows', type=float, default=10,
+            help='Mean number of subscriptions per user.'
+        )
+        parser.add_argument(
+            '--ingredients', type=float, default=7,
+            help='Mean number of ingredients per recipe.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help='Number of rows written at once.'
+        )
+        parser.add_argument(
+            '--password', default='seed-password',
+            help='Password of every generated user.'
+        )
+
+    def handle(self, *args, **options):
+        """Handle function."""
+        self.chunk_size = options['chunk_size']
+        self.use_copy = connection.vendor == 'postgresql'
+        self.rng = random.Random(options['seed'])
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        tag_ids = list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError(
+                'Import ingredients and tags first: manage.py import '
+                'ingredient=data/ingredients.csv tag=data/tags.json'
+            )
+        self.ingredient_names = dict(
+            Ingredient.objects.values_list('pk', 'name')
+        )
+        users = max(2, round(USERS_PER_SCALE * options['scale']))
+        recipes = max(1, round(RECIPES_PER_SCALE * options['scale']))
+        first_user = (User.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        first_recipe = (
+            Recipe.objects.aggregate(last=Max('pk'))['last'] or 0
+        ) + 1
+        user_ids = range(first_user, first_user + users)
+        recipe_ids = range(first_recipe, first_recipe + recipes)
+        skew = options['skew']
+        started = monotonic()
+        self.written = 0
+
+        self.write(User, self.users(user_ids, options['password']))
+        self.write_recipes(
+            recipe_ids,
+            Sampler(self.rng, user_ids, skew),
+            Sampler(self.rng, ingredient_ids, skew),
+            tag_ids,
+            options['ingredients']
+        )
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Recipe]
+            ):
+                cursor.execute(sql)
+        popular_recipes = Sampler(self.rng, recipe_ids, skew)
+        self.write(Favorite, self.relations(
+            Favorite, 'recipes_id', user_ids, popular_recipes,
+            options['favorites']
+        ))
+        self.write(ShoppingCart, self.relations(
+            ShoppingCart, 'recipes_id', user_ids, popular_recipes,
+            options['cart']
+        ))
+        self.write(Subscribe, self.relations(
+            Subscribe, 'subscriptions_id', user_ids,
+            Sampler(self.rng, user_ids, skew), options['follows'],
+            exclude_self=True
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {self.written} rows in {monotonic() - started:.1f}s.'
+        ))
+        self.refresh_derived(first_user, first_recipe)
+        self.stdout.write(self.style.SUCCESS(
+            f'Done in {monotonic() - started:.1f}s.'
+        ))
+
+    def users(self, user_ids, password):
+        password = make_password(password)
+        for user_id in user_ids:
+            yield User(
+                id=user_id,
+                email=f'user{user_id}@seed.example',
+                username=f'user{user_id}',
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                password=password,
+                date_joined=START_DATE,
+            )
+
+    def placeholder_image(self):
+        """Stored recipe image and its variants shared by all recipes."""
+        content = BytesIO()
+        Image.new('RGB', (640, 480), (230, 160, 60)).save(content, 'JPEG')
+        upload_to = Recipe._meta.get_field('image').upload_to
+        name = default_storage.save(
+            upload_to + 'seed.jpg', ContentFile(content.getvalue())
+        )
+        with default_storage.open(name) as image:
+            return name, save_variants(
+                name, image, upload_to, RECIPE_IMAGE_VARIANTS
+            )
+
+    def write_recipes(self, recipe_ids, authors, ingredients, tag_ids, mean):
+        image, variants = self.placeholder_image()
+        ids = iter(recipe_ids)
+        while True:
+            chunk = list(islice(ids, self.chunk_size))
+            if not chunk:
+                return
+            recipes, rows, tags = [], [], []
+            for recipe_id, author_id in zip(
+                chunk, authors.choices(len(chunk))
+            ):
+                pub_date = START_DATE + timedelta(
+                    seconds=self.rng.randrange(PERIOD_SECONDS)
+                )
+                items = ingredients.sample(
+                    1 + int(self.rng.expovariate(1 / mean))
+                )
+                names = [self.ingredient_names[pk] for pk in items]
+                recipes.append(Recipe(
+                    id=recipe_id,
+                    author_id=author_id,
+                    name=f'{self.rng.choice(DISHES)}: {names[0]}'[
+                        :MAX_LENGTH_FOR_NAME],
+                    text=f'Понадобится: {", ".join(names)}.',
+                    image=image,
+                    image_variants=variants,
+                    cooking_time=self.rng.randint(5, 180),
+                    pub_date=pub_date,
+                    updated_at=pub_date,
+                ))
+                rows.extend(
+                    IngredientInRecipe(
+                        recipe_id=recipe_id, ingredient_id=ingredient_id,
+                        amount=self.rng.randint(1, 500)
+                    )
+                    for ingredient_id in items
+                )
+                tags.extend(
+                    Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                    for tag_id in self.rng.sample(
+                        tag_ids, self.rng.randint(1, min(3, len(tag_ids)))
+                    )
+                )
+            self.write(Recipe, recipes)
+            self.write(IngredientInRecipe, rows)
+            self.write(Recipe.tags.through, tags)
+
+    def relations(self, model, target, user_ids, targets, mean,
+                  exclude_self=False):
+        """
+        Rows of model linking users with sampled targets.
+
+        With exclude_self the targets are users, and no user is linked
+        to their own id.
+        """
+        for user_id in user_ids:
+            count = int(self.rng.expovariate(1 / mean)) if mean else 0
+            for target_id in targets.sample(
+                count, exclude=user_id if exclude_self else None
+            ):
+                yield model(user_id=user_id, **{target: target_id})
+
+    def write(self, model, objects):
+        """Write objects in chunks by COPY or a single executemany INSERT."""
+        objects = iter(objects)
+        count, started = 0, monotonic()
+        while True:
+            chunk = list(islice(objects, self.chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                (self.copy if self.use_copy else self.insert)(model, chunk)
+            count += len(chunk)
+        elapsed = monotonic() - started
+        self.written += count
+        self.stdout.write(
+            f'  {model._meta.label}: {count} rows, '
+            f'{count / elapsed if elapsed else 0:.0f} rows/s'
+        )
+
+    @staticmethod
+    def values(model, objects):
+        """Columns and prepared values of objects, bypassing pre_save."""
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key or objects[0].pk is not None
+        ]
+        rows = (
+            [
+                field.get_db_prep_save(getattr(obj, field.attname), connection)
+                for field in fields
+            ]
+            for obj in objects
+        )
+        return [field.column for field in fields], rows
+
+    def insert(self, model, objects):
+        # bulk_create on SQLite splits rows by the query parameter limit
+        # and applies auto_now, one prepared statement does neither.
+        columns, rows = self.values(model, objects)
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {quote(model._meta.db_table)} '
+                f'({", ".join(map(quote, columns))}) '
+                f'VALUES ({", ".join(["%s"] * len(columns))})',
+                list(rows)
+            )
+
+    def copy(self, model, objects):
+        columns, rows = self.values(model, objects)
+        quote = connection.ops.quote_name
+        content = StringIO()
+        for row in rows:
+            content.write('\t'.join(map(copy_value, row)) + '\n')
+        content.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {quote(model._meta.db_table)} '
+                f'({", ".join(map(quote, columns))}) FROM STDIN',
+                content
+            )
+
+    def refresh_derived(self, first_user, first_recipe):
+        """Counters, shopping lists and feeds of the generated rows."""
+        started = monotonic()
+        with transaction.atomic():
+            Recipe.objects.filter(pk__gte=first_recipe).refresh_counters()
+            User.objects.filter(pk__gte=first_user).update(
+                recipes_count=count_of(Recipe, 'author'),
+                followers_count=count_of(Subscribe, 'subscriptions'),
+            )
+            items = ShoppingListItem.rebuild()
+            entries = TimelineEntry.rebuild()
+        schedule_ingredient_index_rebuild()
+        self.stdout.write(
+            f'  Counters, {items} shopping list rows and {entries} feed '
+            f'entries in {monotonic() - started:.1f}s.'
+        )
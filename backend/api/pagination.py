@@ -1,5 +1,10 @@
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
 
 
 class CustomPagination(PageNumberPagination):
@@ -7,3 +12,137 @@ class CustomPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     page_size = settings.PAGE_SIZE
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация рецептов по (pub_date, id).
+
+    Страница выбирается условием по позиции последнего рецепта,
+    без OFFSET. Общее количество считается только при count=true.
+    """
+
+    page_size_query_param = 'limit'
+    page_size = settings.PAGE_SIZE
+    count_query_param = 'count'
+    ordering = ('-pub_date', '-id')
+
+    def decode_cursor(self, request):
+        """Пустой параметр cursor означает первую страницу."""
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        cursor = super().decode_cursor(request)
+        try:
+            pub_date, pk = cursor.position.split('|')
+            position = (parse_datetime(pub_date), int(pk))
+        except (AttributeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def encode_position(self, recipe, reverse):
+        position = f'{recipe.pub_date.isoformat()}|{recipe.pk}'
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=reverse, position=position)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.count = None
+        if request.query_params.get(self.count_query_param) in (
+            'true', 'True', '1'
+        ):
+            self.count = queryset.count()
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor.reverse
+        if reverse:
+            queryset = queryset.order_by('pub_date', 'id')
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if cursor is not None:
+            pub_date, pk = cursor.position
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'pub_date__{lookup}': pub_date})
+                | Q(pub_date=pub_date, **{f'id__{lookup}': pk})
+            )
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+
+class FeedPagination(RecipeCursorPagination):
+    """
+    Курсорная пагинация ленты подписок.
+
+    Вместо набора запросов получает ленту с методом page(position, size),
+    листается только вперёд.
+    """
+
+    def paginate_queryset(self, feed, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.count = None
+        cursor = self.decode_cursor(request)
+        results = feed.page(
+            cursor.position if cursor else None, self.page_size + 1
+        )
+        self.has_next = len(results) > self.page_size
+        self.has_previous = False
+        self.page = results[:self.page_size]
+        return self.page
+
+
+class RecipePagination(CustomPagination):
+    """
+    Пагинация рецептов.
+
+    По умолчанию постраничная, с параметром cursor - курсорная.
+    """
+
+    cursor_pagination_class = RecipeCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_pagination_class.cursor_query_param in (
+            request.query_params
+        ):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
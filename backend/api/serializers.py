@@ -1,27 +1,30 @@
 from django.core.exceptions import ValidationError
 from django.db.transaction import atomic
 from rest_framework import status
-from rest_framework.fields import IntegerField, SerializerMethodField
+from rest_framework.fields import (IntegerField, ListField, ReadOnlyField,
+                                   SerializerMethodField)
 from rest_framework.relations import PrimaryKeyRelatedField
-from rest_framework.serializers import ModelSerializer
-from drf_extra_fields.fields import Base64ImageField
+from rest_framework.serializers import (ListSerializer, ModelSerializer,
+                                        Serializer)
 
-from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                            ShoppingCart, Tag)
-from users.serializers import MyUserSerializer
+from foodgram.images import Base64ImageField, ImageVariantsField
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingListItem, Tag)
+from users.serializers import MyUserSerializer, ViewerStateListSerializer
+from users.viewer_state import get_viewer_state
+
+from .constants import BULK_RECIPES_LIMIT
+from .signals import muted_signals
 
 
 class IngredientForRecipeReadSerializer(ModelSerializer):
     """Сериализатор для чтения отдельного ингредиента в рецепте."""
-    amount = SerializerMethodField(read_only=True)
-
-    def get_amount(self, obj):
-        """Получение количества ингредиента в рецепте."""
-        amount = obj.ingredients_list.last().amount
-        return amount
+    id = ReadOnlyField(source='ingredient.id')
+    name = ReadOnlyField(source='ingredient.name')
+    measurement_unit = ReadOnlyField(source='ingredient.measurement_unit')
 
     class Meta:
-        model = Ingredient
+        model = IngredientInRecipe
         fields = ('id', 'name', 'measurement_unit', 'amount',)
 
 
@@ -54,36 +57,70 @@ class RecipeReadSerializer(ModelSerializer):
     """Сериализатор для чтения рецептов."""
     tags = TagSerializer(many=True, read_only=True)
     author = MyUserSerializer(read_only=True)
-    ingredients = IngredientForRecipeReadSerializer(many=True, read_only=True)
+    ingredients = IngredientForRecipeReadSerializer(
+        source='ingredients_list', many=True, read_only=True
+    )
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
     image = Base64ImageField()
+    image_variants = ImageVariantsField('image')
+
+    def get_viewer_ids(self, recipes):
+        """Рецепты и авторы, для которых нужно состояние пользователя."""
+        return (
+            [recipe.id for recipe in recipes],
+            [recipe.author_id for recipe in recipes]
+        )
 
     def get_is_in_shopping_cart(self, obj):
         """Получение признака того, что рецепт в корзине покупок."""
-        user = self.context.get('request').user
-        return (user.is_authenticated and ShoppingCart.objects.filter(
-            user=user, recipes=obj).exists()
-        )
+        state = get_viewer_state(self.context.get('request'))
+        return state.is_in_shopping_cart(obj.id)
 
     def get_is_favorited(self, obj):
         """Получение признака того, что рецепт в избранном."""
-        user = self.context.get('request').user
-        return (user.is_authenticated and Favorite.objects.filter(
-            user=user, recipes=obj).exists()
-        )
+        state = get_viewer_state(self.context.get('request'))
+        return state.is_favorited(obj.id)
 
     class Meta:
         model = Recipe
+        list_serializer_class = ViewerStateListSerializer
         fields = (
             'id', 'tags',
             'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image',
+            'name', 'image', 'image_variants',
             'text', 'cooking_time',
         )
 
 
+class AuthorCardSerializer(MyUserSerializer):
+    """Карточка автора без признаков, зависящих от пользователя."""
+
+    class Meta(MyUserSerializer.Meta):
+        fields = tuple(
+            field for field in MyUserSerializer.Meta.fields
+            if field != 'is_subscribed'
+        )
+
+
+class RecipeDocumentSerializer(RecipeReadSerializer):
+    """
+    Часть рецепта, одинаковая для всех пользователей.
+
+    Используется для кэша рецептов, поэтому ссылки на изображения
+    остаются относительными.
+    """
+    author = AuthorCardSerializer(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        list_serializer_class = ListSerializer
+        fields = tuple(
+            field for field in RecipeReadSerializer.Meta.fields
+            if field not in ('is_favorited', 'is_in_shopping_cart',)
+        )
+
+
 class RecipeRecordSerializer(ModelSerializer):
     """Сериализатор для записи рецептов."""
     author = MyUserSerializer(read_only=True)
@@ -132,40 +169,104 @@ class RecipeRecordSerializer(ModelSerializer):
         return value
 
     def validate_ingredients(self, value):
-        """Валидатор для поля ingredients."""
+        """
+        Валидатор для поля ingredients.
+
+        Ингредиенты проверяются одним запросом, найденные объекты
+        добавляются к данным под ключом ingredient.
+        """
         ingredients = value
-        for ingredient in ingredients:
-            object = Ingredient.objects.filter(id=ingredient['id'])
-            if not object.exists():
-                raise ValidationError(
-                    message=f'Ингредиент {ingredient["id"]} не существует.',
-                    code=status.HTTP_400_BAD_REQUEST
-                )
         if not ingredients:
             raise ValidationError(
                 message='Нужен хотя бы один ингредиент.',
                 code=status.HTTP_400_BAD_REQUEST
             )
-        unique_values = set([ingredient['id'] for ingredient in ingredients])
-        if len(unique_values) != len(ingredients):
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
             raise ValidationError(
                 message='Ингредиенты должны быть уникальными.',
                 code=status.HTTP_400_BAD_REQUEST
             )
+        objects = Ingredient.objects.in_bulk(ingredient_ids)
+        for ingredient in ingredients:
+            if ingredient['id'] not in objects:
+                raise ValidationError(
+                    message=f'Ингредиент {ingredient["id"]} не существует.',
+                    code=status.HTTP_400_BAD_REQUEST
+                )
+            ingredient['ingredient'] = objects[ingredient['id']]
         return value
 
-    @atomic
     def create_ingredients_in_recipe(self, ingredients, recipe):
         """Функция создания объектов IngredientInRecipe."""
-        IngredientInRecipe.objects.bulk_create([
+        return IngredientInRecipe.objects.bulk_create([
             IngredientInRecipe(
-                ingredient_id=ingredient['id'],
+                ingredient=ingredient['ingredient'],
                 recipe=recipe,
                 amount=ingredient['amount']
             )
             for ingredient in ingredients
         ])
 
+    def update_ingredients_in_recipe(self, ingredients, recipe):
+        """
+        Функция изменения объектов IngredientInRecipe.
+
+        Записываются только отличия от текущего состава рецепта.
+        """
+        existing, stale = {}, []
+        for row in recipe.ingredients_list.all():
+            if row.ingredient_id in existing:
+                stale.append(row)
+            else:
+                existing[row.ingredient_id] = row
+        rows, changed, created, changes = [], [], [], {}
+        for ingredient in ingredients:
+            row = existing.pop(ingredient['id'], None)
+            if row is None:
+                row = IngredientInRecipe(recipe=recipe, amount=0)
+                created.append(row)
+                changes[ingredient['id']] = (ingredient['amount'], 1)
+            elif row.amount != ingredient['amount']:
+                changed.append(row)
+                changes[ingredient['id']] = (
+                    ingredient['amount'] - row.amount, 0
+                )
+            row.ingredient = ingredient['ingredient']
+            row.amount = ingredient['amount']
+            rows.append(row)
+        stale.extend(existing.values())
+        for row in stale:
+            amount, count = changes.get(row.ingredient_id, (0, 0))
+            changes[row.ingredient_id] = (amount - row.amount, count - 1)
+        if stale:
+            # Сигналы удаления строк не нужны: рецепт уже сохранён,
+            # а списки покупок меняются вместе с остальными отличиями.
+            with muted_signals(IngredientInRecipe):
+                IngredientInRecipe.objects.filter(
+                    pk__in=[row.pk for row in stale]
+                ).delete()
+        IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientInRecipe.objects.bulk_create(created)
+        ShoppingListItem.change_recipe(recipe.id, changes)
+        return rows
+
+    @staticmethod
+    def cache_related(recipe, tags, rows):
+        """Теги и ингредиенты рецепта для ответа без чтения из базы."""
+        related = {
+            'tags': sorted(tags, key=lambda tag: tag.name),
+            'ingredients_list': sorted(
+                rows, key=lambda row: row.ingredient.name
+            ),
+        }
+        recipe._prefetched_objects_cache = {}
+        for name, objects in related.items():
+            queryset = getattr(recipe, name).all()
+            queryset._result_cache = objects
+            queryset._prefetch_done = True
+            recipe._prefetched_objects_cache[name] = queryset
+
     @atomic
     def create(self, validated_data):
         """Функция создания объекта рецепта."""
@@ -173,10 +274,11 @@ class RecipeRecordSerializer(ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        self.create_ingredients_in_recipe(
+        rows = self.create_ingredients_in_recipe(
             ingredients=ingredients,
             recipe=recipe
         )
+        self.written_related = (tags, rows)
         return recipe
 
     @atomic
@@ -185,18 +287,25 @@ class RecipeRecordSerializer(ModelSerializer):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients_in_recipe(
+        rows = self.update_ingredients_in_recipe(
             ingredients=ingredients,
             recipe=instance
         )
-        instance.save()
+        self.written_related = (tags, rows)
+        user = self.context['request'].user
+        if instance.author_id == user.id:
+            instance.author = user
         return instance
 
     def to_representation(self, instance):
-        """Переопределение вcтроенного метода to_representation."""
+        """
+        Переопределение вcтроенного метода to_representation.
+
+        После записи теги и ингредиенты берутся из записанных объектов.
+        """
+        if getattr(self, 'written_related', None):
+            self.cache_related(instance, *self.written_related)
         request = self.context.get('request')
         context = {'request': request}
         return RecipeReadSerializer(instance, context=context).data
@@ -212,7 +321,31 @@ class RecipeRecordSerializer(ModelSerializer):
 
 class RecipeSimpleSerializer(ModelSerializer):
     """Базовый сериализатор для рецептов."""
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeBulkSerializer(Serializer):
+    """Сериализатор списка рецептов для массового добавления и удаления."""
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RECIPES_LIMIT
+    )
+
+    def validate_recipes(self, value):
+        """Валидатор для поля recipes, возвращает объекты рецептов."""
+        recipe_ids = list(dict.fromkeys(value))
+        recipes = Recipe.objects.in_bulk(recipe_ids)
+        missing = [
+            recipe_id for recipe_id in recipe_ids if recipe_id not in recipes
+        ]
+        if missing:
+            raise ValidationError(
+                message=f'Рецептов {missing} в базе данных не cуществует.',
+                code=status.HTTP_400_BAD_REQUEST
+            )
+        return [recipes[recipe_id] for recipe_id in recipe_ids]
@@ -0,0 +1,148 @@
+"""Выгрузка списка покупок в TXT, CSV и JSON."""
+import csv
+import json
+from hashlib import sha1
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from recipes.models import ShoppingCart, ShoppingListItem
+
+from .constants import (SHOPPING_LIST_CACHE_MAX_SIZE,
+                        SHOPPING_LIST_CACHE_TIMEOUT)
+
+SHOPPING_LIST_VERSION = 1
+FORMAT_QUERY_PARAM = 'format'
+DEFAULT_FORMAT = 'txt'
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """
+    Выбор рендерера без учёта параметра format.
+
+    В выгрузке списка покупок format задаёт формат файла,
+    а ошибки по-прежнему возвращаются в JSON.
+    """
+
+    def filter_renderers(self, renderers, format):
+        return renderers
+
+
+class Echo:
+    """Объект-файл для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(rows):
+    for name, unit, amount in rows:
+        yield f'{name}: {amount} {unit}\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for name, unit, amount in rows:
+        yield writer.writerow((name, amount, unit))
+
+
+def render_json(rows):
+    separator = ''
+    yield '['
+    for name, unit, amount in rows:
+        yield separator + json.dumps(
+            {'name': name, 'amount': amount, 'measurement_unit': unit},
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']'
+
+
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'json': ('application/json', render_json),
+}
+
+
+def get_shopping_list_format(request):
+    value = request.query_params.get(FORMAT_QUERY_PARAM, DEFAULT_FORMAT)
+    if value not in FORMATS:
+        raise ValidationError({
+            FORMAT_QUERY_PARAM: (
+                f'Допустимые форматы: {", ".join(FORMATS)}.'
+            )
+        })
+    return value
+
+
+def shopping_cart_hash(user):
+    """Хэш состава корзины с учётом даты изменения рецептов."""
+    digest = sha1()
+    for recipe_id, updated_at in ShoppingCart.objects.filter(
+        user=user
+    ).values_list('recipes_id', 'recipes__updated_at').order_by('recipes_id'):
+        digest.update(f'{recipe_id}:{updated_at.isoformat()};'.encode())
+    return digest.hexdigest()
+
+
+def shopping_list_key(user, list_format, cart_hash):
+    return f'shopping-list:{user.pk}:{list_format}:{cart_hash}'
+
+
+def shopping_list_rows(user):
+    """Суммы ингредиентов из корзины, по одной строке на ингредиент."""
+    return ShoppingListItem.objects.filter(user=user).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by('ingredient__name').iterator()
+
+
+def cached_chunks(chunks, key):
+    """
+    Передача частей файла с сохранением результата в кэш.
+
+    Файлы больше SHOPPING_LIST_CACHE_MAX_SIZE не кэшируются
+    и не накапливаются в памяти.
+    """
+    parts, size = [], 0
+    for chunk in chunks:
+        chunk = chunk.encode('utf-8')
+        if parts is not None:
+            size += len(chunk)
+            if size > SHOPPING_LIST_CACHE_MAX_SIZE:
+                parts = None
+            else:
+                parts.append(chunk)
+        yield chunk
+    if parts is not None:
+        cache.set(
+            key, b''.join(parts),
+            timeout=SHOPPING_LIST_CACHE_TIMEOUT,
+            version=SHOPPING_LIST_VERSION
+        )
+
+
+def shopping_list_response(request):
+    """Потоковый ответ с файлом списка покупок текущего пользователя."""
+    user = request.user
+    list_format = get_shopping_list_format(request)
+    content_type, render = FORMATS[list_format]
+    key = shopping_list_key(user, list_format, shopping_cart_hash(user))
+    content = cache.get(key, version=SHOPPING_LIST_VERSION)
+    if content is not None:
+        chunks = (content,)
+    else:
+        chunks = cached_chunks(render(shopping_list_rows(user)), key)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    filename = f'{user}_go_to_shop.{list_format}'
+    try:
+        filename.encode('ascii')
+        disposition = f'filename="{filename}"'
+    except UnicodeEncodeError:
+        disposition = f"filename*=utf-8''{quote(filename)}"
+    response['Content-Disposition'] = f'attachment; {disposition}'
+    return response
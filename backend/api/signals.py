@@ -0,0 +1,247 @@
+"""Отслеживание изменений рецептов и справочников."""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from foodgram.counters import change_counter
+from foodgram.images import schedule_variants
+from recipes.constants import (FEED_FANOUT_MAX_FOLLOWERS,
+                               RECIPE_IMAGE_VARIANTS)
+from recipes.models import (CatalogVersion, Favorite, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, TimelineEntry)
+from users.constants import AVATAR_IMAGE_VARIANTS
+from users.models import Subscribe
+
+from .ingredient_index import schedule_ingredient_index_rebuild
+
+User = get_user_model()
+
+AUTHOR_CARD_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name', 'avatar',
+     'avatar_variants',)
+)
+
+# Модель связи: (модель со счётчиком, поле связи, поле счётчика).
+COUNTERS = {
+    Favorite: (Recipe, 'recipes_id', 'favorites_count'),
+    ShoppingCart: (Recipe, 'recipes_id', 'cart_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscribe: (User, 'subscriptions_id', 'followers_count'),
+}
+
+
+# Модели, сигналы которых сейчас не обрабатываются.
+_muted_models = ContextVar('muted_models', default=frozenset())
+
+
+@contextmanager
+def muted_signals(*models):
+    """
+    Изменение строк models без обработки сигналов по каждой строке.
+
+    Счётчики, списки покупок и даты изменения рецептов вызывающий
+    код обновляет сам, одним набором запросов.
+    """
+    token = _muted_models.set(_muted_models.get() | set(models))
+    try:
+        yield
+    finally:
+        _muted_models.reset(token)
+
+
+def unless_muted(handler):
+    @wraps(handler)
+    def wrapper(sender, **kwargs):
+        if sender not in _muted_models.get():
+            handler(sender, **kwargs)
+    return wrapper
+
+
+def touch_recipes(recipe_ids):
+    """Обновление даты изменения рецептов, она входит в ключ их кэша."""
+    Recipe.objects.filter(pk__in=list(recipe_ids)).update(
+        updated_at=timezone.now()
+    )
+
+
+def counted_row_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        model, field, counter = COUNTERS[sender]
+        change_counter(model, getattr(instance, field), counter, 1)
+
+
+@unless_muted
+def counted_row_deleted(sender, instance, **kwargs):
+    model, field, counter = COUNTERS[sender]
+    change_counter(model, getattr(instance, field), counter, -1)
+
+
+for counted_model in COUNTERS:
+    post_save.connect(counted_row_saved, sender=counted_model)
+    post_delete.connect(counted_row_deleted, sender=counted_model)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(
+            instance, 'image', 'image_variants', RECIPE_IMAGE_VARIANTS
+        )
+
+
+@receiver(post_save, sender=User)
+def avatar_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_variants(
+            instance, 'avatar', 'avatar_variants', AVATAR_IMAGE_VARIANTS
+        )
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+@unless_muted
+def ingredient_in_recipe_changed(sender, instance, **kwargs):
+    touch_recipes([instance.recipe_id])
+
+
+def update_shopping_lists(rows):
+    """
+    Изменение списков покупок по строкам состава рецептов.
+
+    rows - кортежи (id рецепта, id ингредиента, количество, знак).
+    """
+    changes = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for recipe_id, ingredient_id, amount, sign in rows:
+        change = changes[recipe_id][ingredient_id]
+        change[0] += sign * amount
+        change[1] += sign
+    for recipe_id, recipe_changes in changes.items():
+        ShoppingListItem.change_recipe(recipe_id, recipe_changes)
+
+
+@receiver(pre_save, sender=IngredientInRecipe)
+def remember_ingredient_in_recipe(sender, instance, **kwargs):
+    instance._shopping_list_row = None
+    if instance.pk is not None:
+        instance._shopping_list_row = IngredientInRecipe.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def ingredient_in_recipe_saved(sender, instance, **kwargs):
+    rows = [(instance.recipe_id, instance.ingredient_id, instance.amount, 1)]
+    previous = getattr(instance, '_shopping_list_row', None)
+    if previous is not None:
+        rows.append((*previous, -1))
+    update_shopping_lists(rows)
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+@unless_muted
+def ingredient_in_recipe_deleted(sender, instance, **kwargs):
+    update_shopping_lists(
+        [(instance.recipe_id, instance.ingredient_id, instance.amount, -1)]
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.add_recipe(instance.user_id, instance.recipes_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+@unless_muted
+def shopping_cart_removed(sender, instance, **kwargs):
+    ShoppingListItem.remove_recipe(instance.user_id, instance.recipes_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.backfill(instance.user_id, instance.subscriptions_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def unsubscribed(sender, instance, **kwargs):
+    TimelineEntry.trim(instance.user_id, instance.subscriptions_id)
+    # Счётчик уже уменьшен, ровно FEED_FANOUT_MAX_FOLLOWERS подписчиков -
+    # автор только что перестал быть популярным. Ленты дополняются
+    # после фиксации, чтобы при удалении автора не ссылаться
+    # на удаляемые рецепты.
+    author_id = instance.subscriptions_id
+    if User.objects.filter(
+        pk=author_id, followers_count=FEED_FANOUT_MAX_FOLLOWERS
+    ).exists():
+        transaction.on_commit(
+            lambda: TimelineEntry.backfill_followers(author_id)
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    touch_recipes(
+        Recipe.objects.filter(tags=instance).values_list('id', flat=True)
+    )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_catalog_changed(sender, **kwargs):
+    CatalogVersion.bump(CatalogVersion.TAGS)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(
+            instance.ingredients_list.values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_catalog_changed(sender, **kwargs):
+    CatalogVersion.bump(CatalogVersion.INGREDIENTS)
+    schedule_ingredient_index_rebuild()
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    if created or (
+        update_fields is not None
+        and not AUTHOR_CARD_FIELDS.intersection(update_fields)
+    ):
+        return
+    touch_recipes(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        touch_recipes([instance.pk])
+    elif pk_set is not None:
+        touch_recipes(pk_set)
+    else:
+        touch_recipes(instance.recipes.values_list('id', flat=True))
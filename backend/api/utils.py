@@ -1,15 +1,33 @@
-from io import BytesIO
-
-
-def create_shopping_list_file(shopping_cart):
-    """Функция для создания тестового файла со списком продуктов."""
-    file = BytesIO()
-    for ingredient in shopping_cart:
-        file.write(
-            f"{ingredient['recipes__ingredients__name']}: "
-            f"{ingredient['amount']} "
-            f"{ingredient['recipes__ingredients__measurement_unit']}\n"
-            .encode('utf-8')
+from calendar import timegm
+from hashlib import sha1
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Сильный валидатор ETag из частей состояния ресурса."""
+    return quote_etag(
+        sha1(':'.join(map(str, parts)).encode('utf-8')).hexdigest()
+    )
+
+
+def conditional_response(request, etag, last_modified=None):
+    """Ответ 304, если у клиента актуальная версия ресурса, иначе None."""
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=(
+            timegm(last_modified.utctimetuple()) if last_modified else None
+        )
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    """Добавление ETag и Last-Modified в ответ."""
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(
+            timegm(last_modified.utctimetuple())
         )
-    file.seek(0)
-    return file
+    return response
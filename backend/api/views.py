@@ -1,8 +1,10 @@
-from django.db.models import Sum
-from django.http import FileResponse, HttpResponseRedirect
+from django.db import IntegrityError
+from django.db.transaction import atomic
+from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils import baseconv
+from django.utils.cache import patch_vary_headers
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
@@ -13,18 +15,72 @@ from rest_framework.status import (HTTP_200_OK, HTTP_201_CREATED,
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from .cache import RECIPE_DOCUMENT_VERSION, render_recipes
+from .catalog import catalog_caches
+from .feed import SubscriptionFeed
 from .filters import IngredientFilter, RecipeFilter
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from .pagination import CustomPagination
+from recipes.models import (CatalogVersion, Favorite, Ingredient, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.viewer_state import get_viewer_state
+from .pagination import FeedPagination, RecipePagination
 from .permissions import CurrentUserOrAdmin, CurrentUserOrAdminOrReadOnly
-from .serializers import (IngredientSerializer, RecipeReadSerializer,
-                          RecipeRecordSerializer, RecipeSimpleSerializer,
-                          TagSerializer)
-from .utils import create_shopping_list_file
+from .serializers import (IngredientSerializer, RecipeBulkSerializer,
+                          RecipeReadSerializer, RecipeRecordSerializer,
+                          RecipeSimpleSerializer, TagSerializer)
+from .shopping_list import ShoppingListNegotiation, shopping_list_response
+from .signals import muted_signals
+from .utils import conditional_response, make_etag, set_validators
 
 
-class IngredientViewSet(ModelViewSet):
+class CatalogConditionalMixin:
+    """
+    Чтение справочника с учётом его версии.
+
+    Условные GET-запросы отвечают 304, а готовые JSON-ответы списков
+    берутся из кэша процесса без обращения к ORM и сериализатору.
+    """
+    catalog_name = None
+
+    def conditional(self, request, render):
+        catalog = CatalogVersion.get(self.catalog_name)
+        etag = make_etag(catalog.name, catalog.version)
+        response = conditional_response(request, etag, catalog.updated_at)
+        if response is None:
+            response = render(catalog)
+        return set_validators(response, etag, catalog.updated_at)
+
+    def cached_list(self, request, catalog, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+        cache = catalog_caches[self.catalog_name]
+        key = tuple(
+            (param, tuple(values))
+            for param, values in sorted(request.query_params.lists())
+        )
+        body = cache.get(catalog.version, key)
+        if body is None:
+            response = super().list(request, *args, **kwargs)
+            body = cache.set(catalog.version, key, response.data)
+        return HttpResponse(body, content_type='application/json')
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            request,
+            lambda catalog: self.cached_list(
+                request, catalog, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(
+            request,
+            lambda catalog: super(CatalogConditionalMixin, self).retrieve(
+                request, *args, **kwargs)
+        )
+
+
+class IngredientViewSet(CatalogConditionalMixin, ModelViewSet):
     """Представление для работы с ингредиентами."""
+    catalog_name = CatalogVersion.INGREDIENTS
     queryset = Ingredient.objects.all()
     http_method_names = ['get', ]
     permission_classes = (AllowAny,)
@@ -39,7 +95,58 @@ class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
+
+    def get_queryset(self):
+        """Для чтения нужны только id, остальное берётся из кэша."""
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve',):
+            queryset = queryset.only('id', 'pub_date', 'updated_at', 'author')
+        return queryset
+
+    def get_recipes_etag(self, recipes, *parts):
+        """ETag рецептов с учётом состояния текущего пользователя."""
+        state = get_viewer_state(self.request)
+        state.prime(
+            [recipe.id for recipe in recipes],
+            [recipe.author_id for recipe in recipes]
+        )
+        return make_etag(
+            RECIPE_DOCUMENT_VERSION, self.request.user.pk, *parts, *(
+                (
+                    recipe.id, recipe.updated_at.isoformat(),
+                    state.is_favorited(recipe.id),
+                    state.is_in_shopping_cart(recipe.id),
+                    state.is_subscribed(recipe.author_id),
+                ) for recipe in recipes
+            )
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        etag = self.get_recipes_etag(
+            page, self.paginator.get_paginated_response([]).data
+        )
+        response = conditional_response(request, etag)
+        if response is None:
+            response = self.get_paginated_response(
+                render_recipes(page, request)
+            )
+        patch_vary_headers(response, ('Authorization',))
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        etag = self.get_recipes_etag([recipe])
+        last_modified = (
+            None if request.user.is_authenticated else recipe.updated_at
+        )
+        response = conditional_response(request, etag, last_modified)
+        if response is None:
+            response = Response(render_recipes([recipe], request)[0])
+        patch_vary_headers(response, ('Authorization',))
+        return set_validators(response, etag, last_modified)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -79,6 +186,17 @@ class RecipeViewSet(ModelViewSet):
         )
         return Response({"short-link": short_link}, status=HTTP_200_OK)
 
+    @action(
+        methods=['get', ],
+        detail=False,
+        permission_classes=[CurrentUserOrAdmin, ],
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Функция получения ленты рецептов из подписок."""
+        page = self.paginate_queryset(SubscriptionFeed(request.user))
+        return self.get_paginated_response(render_recipes(page, request))
+
     @action(
         methods=['post', 'delete', ],
         detail=True,
@@ -99,60 +217,106 @@ class RecipeViewSet(ModelViewSet):
             return self.add_recipe_to(Favorite, request.user, pk)
         return self.delete_recipe_from(Favorite, request.user, pk)
 
+    @action(
+        methods=['post', 'delete', ],
+        detail=False,
+        url_path='shopping_cart/bulk',
+        url_name='shopping-cart-bulk'
+    )
+    def shopping_cart_bulk(self, request):
+        """Функция для работы с несколькими рецептами в корзине покупок."""
+        return self.change_recipes_in(ShoppingCart, request)
+
+    @action(
+        methods=['post', 'delete', ],
+        detail=False,
+        url_path='favorite/bulk',
+        url_name='favorite-bulk'
+    )
+    def favorite_bulk(self, request):
+        """Функция для работы с несколькими рецептами в избранном."""
+        return self.change_recipes_in(Favorite, request)
+
     def add_recipe_to(self, model, user, pk):
-        """Функция добавления рецепта в объект модели."""
-        if model.objects.filter(user=user, recipes_id=pk).exists():
+        """
+        Функция добавления рецепта в объект модели.
+
+        Повтор отсекается ограничением уникальности,
+        поэтому одновременные запросы не приводят к ошибке 500.
+        """
+        recipe = get_object_or_404(Recipe, pk=pk)
+        try:
+            with atomic():
+                model.objects.create(user=user, recipes=recipe)
+        except IntegrityError:
             return Response(
                 {'errors': f'Рецепт {pk} в {model.__name__} уже добавлен.'},
                 status=HTTP_400_BAD_REQUEST
             )
-        recipe = get_object_or_404(Recipe, pk=pk)
-        model.objects.create(user=user, recipes=recipe)
         serializer = RecipeSimpleSerializer(recipe)
         return Response(serializer.data, status=HTTP_201_CREATED)
 
     def delete_recipe_from(self, model, user, pk):
         """Функция удаления рецепта из объекта модели."""
+        deleted, _ = model.objects.filter(user=user, recipes_id=pk).delete()
+        if deleted:
+            return Response(status=HTTP_204_NO_CONTENT)
         if not Recipe.objects.filter(pk=pk).exists():
             return Response(
                 {'errors': f'Рецепта {pk} в базе данных не cуществует.'},
                 status=HTTP_404_NOT_FOUND
             )
-        if not model.objects.filter(user=user, recipes_id=pk).exists():
-            return Response(
-                {'errors': f'Рецепта {pk} в {model.__name__} нет.'},
-                status=HTTP_400_BAD_REQUEST
-            )
-        object = get_object_or_404(model, user=user, recipes_id=pk)
-        object.delete()
-        return Response(status=HTTP_204_NO_CONTENT)
+        return Response(
+            {'errors': f'Рецепта {pk} в {model.__name__} нет.'},
+            status=HTTP_400_BAD_REQUEST
+        )
+
+    def change_recipes_in(self, model, request):
+        """
+        Функция массового добавления или удаления рецептов.
+
+        Уже добавленные рецепты пропускаются, отсутствующие при удалении
+        не считаются ошибкой. Всё выполняется в одной транзакции,
+        счётчики и список покупок пересчитываются один раз.
+        """
+        serializer = RecipeBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipes = serializer.validated_data['recipes']
+        user = request.user
+        recipe_ids = [recipe.id for recipe in recipes]
+        with atomic():
+            if request.method == 'DELETE':
+                with muted_signals(model):
+                    model.objects.filter(
+                        user=user, recipes__in=recipe_ids
+                    ).delete()
+            else:
+                model.objects.bulk_create(
+                    [model(user=user, recipes=recipe) for recipe in recipes],
+                    ignore_conflicts=True
+                )
+            Recipe.objects.filter(pk__in=recipe_ids).refresh_counters()
+            if model is ShoppingCart:
+                ShoppingListItem.rebuild([user.id])
+        if request.method == 'DELETE':
+            return Response(status=HTTP_204_NO_CONTENT)
+        serializer = RecipeSimpleSerializer(recipes, many=True)
+        return Response(serializer.data, status=HTTP_201_CREATED)
 
     @action(
         methods=['get', ],
         detail=False,
-        permission_classes=[CurrentUserOrAdmin, ]
+        permission_classes=[CurrentUserOrAdmin, ],
+        content_negotiation_class=ShoppingListNegotiation
     )
     def download_shopping_cart(self, request):
         """Функция для работы с загрузкой файла списка покупок."""
-        user = request.user
-        shopping_cart = ShoppingCart.objects.filter(
-            user=user).values(
-                'recipes__ingredients__name',
-                'recipes__ingredients__measurement_unit').annotate(
-                    amount=Sum('recipes__ingredients_list__amount')).order_by(
-                        'recipes__ingredients__name'
-        )
-        file = create_shopping_list_file(shopping_cart)
-        return FileResponse(
-            file,
-            content_type='text/plain',
-            as_attachment=True,
-            filename=f'{user}_go_to_shop.txt'
-        )
+        return shopping_list_response(request)
 
 
-class TagViewSet(ModelViewSet):
+class TagViewSet(CatalogConditionalMixin, ModelViewSet):
     """Представление для работы с тегами."""
+    catalog_name = CatalogVersion.TAGS
     queryset = Tag.objects.all()
     http_method_names = ['get', ]
     serializer_class = TagSerializer
@@ -16,3 +16,16 @@ class Messages:
 
 
 DEFAULT_PAGE_SIZE = 6
+DEFAULT_RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+DEFAULT_IMAGE_VARIANT_WORKERS = 2
+IMAGE_VARIANT_QUALITY = 80
+MEDIA_HASH_SHARDS = 2
+MEDIA_HASH_SHARD_LENGTH = 2
+MEDIA_GC_MIN_AGE = 60 * 60
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_UPLOAD_HEADER_MAX_SIZE = 1024 * 1024
+IMAGE_UPLOAD_FORMATS = {
+    'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp',
+}
+BASE64_CHUNK_SIZE = 64 * 1024
@@ -0,0 +1,42 @@
+"""Денормализованные счётчики, общие для приложений проекта."""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+class CounterFieldsMixin:
+    """
+    Защита счётчиков модели от перезаписи при save().
+
+    Счётчики из COUNTER_FIELDS меняются только запросами UPDATE с F(),
+    поэтому save() существующего объекта их не сохраняет.
+    """
+    COUNTER_FIELDS = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        return super().save(*args, **kwargs)
+
+
+def count_of(model, field):
+    """Количество строк model, ссылающихся на текущую строку через field."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(count=Count('pk')).values('count')
+        ),
+        0
+    )
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарное изменение счётчика, не опускающее его ниже нуля."""
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
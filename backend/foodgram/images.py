@@ -0,0 +1,279 @@
+"""Уменьшенные копии загруженных изображений."""
+import binascii
+import logging
+import os
+import struct
+from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+from rest_framework.fields import Field, ImageField
+
+from .constants import (BASE64_CHUNK_SIZE, IMAGE_UPLOAD_FORMATS,
+                        IMAGE_UPLOAD_HEADER_MAX_SIZE, IMAGE_UPLOAD_MAX_PIXELS,
+                        IMAGE_UPLOAD_MAX_SIZE, IMAGE_VARIANT_QUALITY)
+
+logger = logging.getLogger(__name__)
+
+SOURCE_KEY = 'source'
+
+if features.check('webp'):
+    VARIANT_FORMAT, VARIANT_EXTENSION = 'WEBP', 'webp'
+else:
+    VARIANT_FORMAT, VARIANT_EXTENSION = 'JPEG', 'jpg'
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_VARIANT_WORKERS,
+            thread_name_prefix='image-variants'
+        )
+    return _executor
+
+
+def render_variants(file, sizes):
+    """
+    Копии изображения, вписанные в размеры sizes.
+
+    Копии сохраняются без метаданных, ориентация из EXIF
+    применяется к самому изображению.
+    """
+    with Image.open(file) as image:
+        image.draft('RGB', max(sizes.values()))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (
+            image.mode == 'P' and 'transparency' in image.info
+        )
+        if VARIANT_FORMAT == 'WEBP' and has_alpha:
+            image = image.convert('RGBA')
+        else:
+            image = image.convert('RGB')
+    for variant, size in sizes.items():
+        copy = image.copy()
+        copy.thumbnail(size, Image.LANCZOS)
+        content = BytesIO()
+        copy.save(
+            content, VARIANT_FORMAT,
+            quality=IMAGE_VARIANT_QUALITY, optimize=True
+        )
+        yield variant, ContentFile(content.getvalue())
+
+
+def variant_name(upload_to, variant):
+    return os.path.join(
+        upload_to, 'variants', f'{variant}.{VARIANT_EXTENSION}'
+    )
+
+
+def save_variants(name, image, upload_to, sizes):
+    """Сохранение копий открытого изображения name, возвращает их пути."""
+    variants = {SOURCE_KEY: name}
+    for variant, content in render_variants(image, sizes):
+        variants[variant] = default_storage.save(
+            variant_name(upload_to, variant), content
+        )
+    return variants
+
+
+def build_variants(model, pk, image_field, variants_field, sizes):
+    """
+    Создание копий изображения объекта и запись их путей в variants_field.
+
+    Возвращает False, если у объекта нет изображения или
+    копии для текущего изображения уже есть. Копии прежнего
+    изображения удаляет команда collect_media_garbage.
+    """
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return False
+    image = getattr(instance, image_field)
+    previous = getattr(instance, variants_field) or {}
+    if not image or previous.get(SOURCE_KEY) == image.name:
+        return False
+    with image.open('rb'):
+        variants = save_variants(
+            image.name, image,
+            model._meta.get_field(image_field).upload_to, sizes
+        )
+    setattr(instance, variants_field, variants)
+    instance.save(update_fields=[variants_field] + [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+    ])
+    return True
+
+
+def _build_logged(*args):
+    try:
+        build_variants(*args)
+    except Exception:
+        logger.exception('Не удалось создать копии изображения %s.', args)
+
+
+def _build_in_worker(*args):
+    try:
+        _build_logged(*args)
+    finally:
+        connection.close()
+
+
+def schedule_variants(instance, image_field, variants_field, sizes):
+    """
+    Создание копий после фиксации транзакции.
+
+    Копии создаются в пуле из IMAGE_VARIANT_WORKERS потоков,
+    при нуле потоков - сразу в текущем.
+    """
+    image = getattr(instance, image_field)
+    variants = getattr(instance, variants_field) or {}
+    if not image or variants.get(SOURCE_KEY) == image.name:
+        return
+    args = (type(instance), instance.pk, image_field, variants_field, sizes)
+    if settings.IMAGE_VARIANT_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(_build_in_worker, *args)
+        )
+    else:
+        transaction.on_commit(lambda: _build_logged(*args))
+
+
+class ImageVariantsField(Field):
+    """
+    Ссылки на копии изображения.
+
+    Пока копии текущего изображения не готовы, возвращается
+    пустой словарь. Без request в контексте ссылки относительные.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        image = getattr(instance, self.image_field)
+        variants = super().get_attribute(instance) or {}
+        if not image or variants.get(SOURCE_KEY) != image.name:
+            return {}
+        return {
+            variant: name for variant, name in variants.items()
+            if variant != SOURCE_KEY
+        }
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for variant, name in value.items():
+            url = default_storage.url(name)
+            urls[variant] = (
+                request.build_absolute_uri(url) if request is not None
+                else url
+            )
+        return urls
+
+
+class Base64ImageField(ImageField):
+    """
+    Изображение, переданное строкой base64 или data URL.
+
+    Размер файла оценивается по длине строки, строка декодируется
+    частями в файл загрузки: в памяти для небольших файлов, иначе
+    во временный файл на диске, который хранилище потом перемещает.
+    Формат и размеры изображения проверяются по заголовку,
+    до декодирования остальной строки.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Изображение должно быть строкой base64.',
+        'too_large': 'Размер изображения больше {max_size} байт.',
+        'too_many_pixels': 'В изображении больше {max_pixels} пикселей.',
+        'unsupported_format': 'Допустимые форматы изображения: {formats}.',
+    }
+
+    def to_internal_value(self, data):
+        if data in (None, ''):
+            return None
+        if not isinstance(data, str):
+            self.fail('invalid_base64')
+        if data.startswith('data:'):
+            data = data.partition(';base64,')[2]
+        if not data or len(data) % 4:
+            self.fail('invalid_base64')
+        size = len(data) // 4 * 3 - data[-2:].count('=')
+        if size > IMAGE_UPLOAD_MAX_SIZE:
+            self.fail('too_large', max_size=IMAGE_UPLOAD_MAX_SIZE)
+        upload = self.decode(data, size)
+        return super().to_internal_value(upload)
+
+    def new_upload(self, size):
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            return TemporaryUploadedFile('image', None, size, None)
+        return InMemoryUploadedFile(BytesIO(), None, 'image', None, size, None)
+
+    def decode(self, data, size):
+        upload = self.new_upload(size)
+        try:
+            image_format = None
+            next_probe = 0
+            for start in range(0, len(data), BASE64_CHUNK_SIZE):
+                try:
+                    upload.write(b64decode(
+                        data[start:start + BASE64_CHUNK_SIZE], validate=True
+                    ))
+                except (binascii.Error, ValueError):
+                    self.fail('invalid_base64')
+                written = upload.tell()
+                if image_format is None and (
+                    written >= next_probe or written == size
+                ):
+                    image_format = self.probe(upload, written)
+                    next_probe = written * 2
+            if image_format is None:
+                self.fail('invalid_image')
+        except Exception:
+            upload.close()
+            raise
+        upload.name = f'{uuid4()}.{IMAGE_UPLOAD_FORMATS[image_format]}'
+        upload.content_type = Image.MIME[image_format]
+        upload.size = size
+        upload.seek(0)
+        return upload
+
+    def probe(self, upload, written):
+        """
+        Формат изображения по уже декодированному началу файла.
+
+        Возвращает None, если заголовок ещё не получен целиком:
+        Pillow сообщает об обрезанном заголовке разными исключениями,
+        например при больших сегментах EXIF или ICC в JPEG.
+        """
+        upload.seek(0)
+        try:
+            with Image.open(upload) as image:
+                image_format, (width, height) = image.format, image.size
+        except Image.DecompressionBombError:
+            self.fail('too_many_pixels', max_pixels=IMAGE_UPLOAD_MAX_PIXELS)
+        except (OSError, SyntaxError, struct.error):
+            if written >= IMAGE_UPLOAD_HEADER_MAX_SIZE:
+                self.fail('invalid_image')
+            return None
+        finally:
+            upload.seek(0, os.SEEK_END)
+        if image_format not in IMAGE_UPLOAD_FORMATS:
+            self.fail(
+                'unsupported_format', formats=', '.join(IMAGE_UPLOAD_FORMATS)
+            )
+        if width * height > IMAGE_UPLOAD_MAX_PIXELS:
+            self.fail('too_many_pixels', max_pixels=IMAGE_UPLOAD_MAX_PIXELS)
+        return image_format
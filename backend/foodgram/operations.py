@@ -0,0 +1,27 @@
+"""Операции миграций, общие для приложений проекта."""
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db.migrations.operations import AddIndex
+
+
+class AddIndexConcurrentlyIfSupported(AddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY в PostgreSQL и обычный индекс в других СУБД.
+
+    Миграция с этой операцией должна быть объявлена с atomic = False.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state)
+        return AddIndex.database_forwards(
+            self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state)
+        return AddIndex.database_backwards(
+            self, app_label, schema_editor, from_state, to_state)
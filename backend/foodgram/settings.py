@@ -1,7 +1,8 @@
 import os
 from pathlib import Path
 
-from .constants import DEFAULT_PAGE_SIZE
+from .constants import (DEFAULT_IMAGE_VARIANT_WORKERS, DEFAULT_PAGE_SIZE,
+                        DEFAULT_RECIPE_CACHE_TIMEOUT)
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -30,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'api.apps.ApiConfig',
     'users.apps.UsersConfig',
@@ -91,6 +93,41 @@ DATABASES = {
     }
 }
 
+# DB_ENGINE=sqlite - локальный запуск без PostgreSQL.
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+RECIPE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_CACHE_TIMEOUT', DEFAULT_RECIPE_CACHE_TIMEOUT))
+
+INGREDIENT_INDEX_PATH = os.getenv(
+    'INGREDIENT_INDEX_PATH', BASE_DIR / 'data' / 'ingredient_index.bin')
+
+IMPORTERS = {
+    'ingredient': 'api.importer.IngredientImport',
+    'tag': 'api.importer.TagImport',
+    'user': 'api.importer.UserImport',
+    'recipe': 'api.importer.RecipeImport',
+}
+
+IMAGE_VARIANT_WORKERS = int(
+    os.getenv('IMAGE_VARIANT_WORKERS', DEFAULT_IMAGE_VARIANT_WORKERS))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -159,6 +196,9 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = '/media'
+
+DEFAULT_FILE_STORAGE = 'foodgram.storage.ContentAddressedStorage'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,57 @@
+"""Хранилище медиафайлов с именами по содержимому."""
+import os
+from hashlib import sha256
+
+from django.core.files.storage import FileSystemStorage
+
+from .constants import MEDIA_HASH_SHARDS, MEDIA_HASH_SHARD_LENGTH
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файлы называются по хэшу SHA-256 содержимого.
+
+    Файл сохраняется в каталог из upload_to с вложенными
+    подкаталогами из начала хэша: recipes/recipe_images/ab/cd/abcd....png.
+    Одинаковое содержимое хранится один раз, а файлы не меняются
+    после записи, поэтому их можно кэшировать без ограничения срока.
+    Удалять файлы можно только командой collect_media_garbage:
+    один файл может быть у нескольких объектов.
+    """
+
+    @staticmethod
+    def content_hash(content):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+    def hashed_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        digest = self.content_hash(content)
+        shards = [
+            digest[start:start + MEDIA_HASH_SHARD_LENGTH]
+            for start in range(
+                0, MEDIA_HASH_SHARDS * MEDIA_HASH_SHARD_LENGTH,
+                MEDIA_HASH_SHARD_LENGTH
+            )
+        ]
+        return os.path.join(directory, *shards, digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            # Свежая дата изменения защищает файл от сборки мусора,
+            # пока объект с этим файлом не сохранён.
+            os.utime(self.path(name))
+            return name
+        saved = super()._save(name, content)
+        if hasattr(content, 'temporary_file_path'):
+            # Временный файл перемещён в хранилище.
+            content.close()
+        if saved != name:
+            # Тот же файл одновременно записал другой процесс.
+            self.delete(saved)
+        return name
@@ -47,13 +47,10 @@ class RecipeAdmin(CommonRecipesAdmin):
         'name',
         'author',
         'pub_date',
-        'count_in_favorite',
+        'favorites_count',
+        'cart_count',
     )
 
-    def count_in_favorite(self, obj):
-        return Favorite.objects.filter(recipes=obj).count()
-    count_in_favorite.short_description = 'раз в избранном'
-
     search_fields = (
         'name', 'author__username',
         'author__email', 'tags__name',
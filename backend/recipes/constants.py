@@ -2,3 +2,7 @@ MIN_COOKING_TIME = 1
 MAX_LENGTH_FOR_NAME = 256
 MIN_AMOUNT_OF_INGREDIENT = 1
 LIST_PER_PAGE = 15
+SEARCH_CONFIG = 'russian'
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_BACKFILL_RECIPES = 100
+RECIPE_IMAGE_VARIANTS = {'card': (480, 480), 'detail': (1280, 1280)}
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:13
+
+from django.db import migrations, models
+
+from foodgram.operations import AddIndexConcurrentlyIfSupported
+
+RECIPE_TAGS_INDEX = 'recipes_recipe_tags_tag_recipe_idx'
+
+
+def create_recipe_tags_index(apps, schema_editor):
+    concurrently = (
+        'CONCURRENTLY ' if schema_editor.connection.vendor == 'postgresql'
+        else ''
+    )
+    schema_editor.execute(
+        f'CREATE INDEX {concurrently}IF NOT EXISTS {RECIPE_TAGS_INDEX} '
+        'ON recipes_recipe_tags (tag_id, recipe_id)'
+    )
+
+
+def drop_recipe_tags_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS {RECIPE_TAGS_INDEX}')
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recipes', '0012_recipe_search_vector'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='ingredientinrecipe',
+            index=models.Index(fields=['recipe', 'ingredient'], include=('amount',), name='ingredient_in_recipe_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ),
+        AddIndexConcurrentlyIfSupported(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.RunPython(
+            create_recipe_tags_index, drop_recipe_tags_index
+        ),
+    ]
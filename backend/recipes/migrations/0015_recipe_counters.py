@@ -0,0 +1,39 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+from foodgram.counters import count_of
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    MyUser = apps.get_model('users', 'MyUser')
+    Recipe.objects.update(
+        favorites_count=count_of(Favorite, 'recipes'),
+        cart_count=count_of(ShoppingCart, 'recipes'),
+    )
+    MyUser.objects.update(recipes_count=count_of(Recipe, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_shoppinglistitem'),
+        ('users', '0007_myuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
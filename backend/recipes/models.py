@@ -1,9 +1,21 @@
+from collections import defaultdict
+from itertools import islice
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField,
+                                            TrigramSimilarity)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import F, Prefetch, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from foodgram.counters import CounterFieldsMixin, count_of
 
-from .constants import (MAX_LENGTH_FOR_NAME, MIN_AMOUNT_OF_INGREDIENT,
-                        MIN_COOKING_TIME)
+from .constants import (FEED_BACKFILL_RECIPES, FEED_FANOUT_MAX_FOLLOWERS,
+                        MAX_LENGTH_FOR_NAME, MIN_AMOUNT_OF_INGREDIENT,
+                        MIN_COOKING_TIME, SEARCH_CONFIG)
 
 User = get_user_model()
 
@@ -50,8 +62,118 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Набор запросов для чтения рецептов."""
+
+    def with_related(self):
+        """Подгрузка автора, тегов и ингредиентов одним набором запросов."""
+        return self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_list',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient').order_by('ingredient__name')
+            ),
+        )
+
+    def search(self, value):
+        """
+        Полнотекстовый поиск по названию и описанию.
+
+        В PostgreSQL используется поисковый вектор со стеммингом и
+        триграммное сходство названия для опечаток, результаты
+        упорядочены по релевантности. В остальных СУБД - icontains.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(
+                Q(name__icontains=value) | Q(text__icontains=value)
+            )
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.annotate(
+            rank=SearchRank(F('search_vector'), query),
+            similarity=TrigramSimilarity('name', value),
+        ).filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).order_by('-rank', '-similarity', '-pub_date')
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Последние limit рецептов каждого автора одним запросом.
+
+        Номер рецепта у автора считается оконной функцией ROW_NUMBER(),
+        без limit возвращаются все рецепты авторов.
+        """
+        author_ids = list(author_ids)
+        if not author_ids:
+            return []
+        ranked = self.filter(author_id__in=author_ids).annotate(
+            author_position=Window(
+                expression=RowNumber(),
+                partition_by=[F('author_id')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )
+        ).order_by()
+        sql, params = ranked.query.sql_with_params()
+        condition = ''
+        if limit is not None:
+            condition = 'WHERE ranked.author_position <= %s'
+            params = (*params, limit)
+        return self.raw(
+            f'SELECT * FROM ({sql}) ranked {condition} '
+            'ORDER BY ranked.author_id, ranked.author_position',
+            params
+        )
+
+    def refresh_counters(self):
+        """Пересчёт счётчиков избранного и корзин по таблицам связей."""
+        return self.update(
+            favorites_count=count_of(Favorite, 'recipes'),
+            cart_count=count_of(ShoppingCart, 'recipes'),
+        )
+
+
+class CatalogVersion(models.Model):
+    """Модель версии справочника тегов или ингредиентов."""
+    TAGS = 'tags'
+    INGREDIENTS = 'ingredients'
+
+    name = models.CharField(
+        'Справочник',
+        unique=True,
+        max_length=MAX_LENGTH_FOR_NAME
+    )
+    version = models.PositiveIntegerField('Версия', default=0)
+    updated_at = models.DateTimeField('Изменено', auto_now=True)
+
+    class Meta:
+        verbose_name = 'Версия справочника'
+        verbose_name_plural = 'Версии справочников'
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+    @classmethod
+    def get(cls, name):
+        return cls.objects.get_or_create(name=name)[0]
+
+    @classmethod
+    def bump(cls, name):
+        """Увеличение версии справочника после изменения данных."""
+        updated = cls.objects.filter(name=name).update(
+            version=models.F('version') + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     """Модель рецепт."""
+    COUNTER_FIELDS = ('favorites_count', 'cart_count')
+
     author = models.ForeignKey(
         User,
         verbose_name='Автор',
@@ -66,6 +188,11 @@ class Recipe(models.Model):
         'Изображение',
         upload_to='recipes/recipe_images/'
     )
+    image_variants = models.JSONField(
+        'Копии изображения',
+        default=dict,
+        editable=False
+    )
     text = models.TextField('Описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -92,11 +219,41 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Добавлено'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменено'
+    )
+    search_vector = SearchVectorField(
+        'Поисковый вектор',
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    cart_count = models.PositiveIntegerField(
+        'В корзинах',
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -130,6 +287,13 @@ class IngredientInRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецепте'
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                include=['amount'],
+                name='ingredient_in_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -194,3 +358,322 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил "{self.recipes}" в Корзину покупок.'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель строки списка покупок.
+
+    Сумма ингредиента по всем рецептам в корзине пользователя,
+    обновляется при изменении корзины и состава рецептов.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField('Количество', default=0)
+    recipes_count = models.PositiveIntegerField('Рецептов', default=0)
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.amount}'
+
+    @classmethod
+    def apply_changes(cls, user_ids, changes):
+        """
+        Изменение строк списков покупок пользователей.
+
+        changes - словарь {id ингредиента: (изменение количества,
+        изменение числа рецептов)}. Строки без рецептов удаляются.
+        """
+        user_ids = list(user_ids)
+        changes = {
+            ingredient_id: change for ingredient_id, change in changes.items()
+            if any(change)
+        }
+        if not user_ids or not changes:
+            return
+        cls.objects.bulk_create(
+            [
+                cls(user_id=user_id, ingredient_id=ingredient_id)
+                for user_id in user_ids
+                for ingredient_id, (_, count) in changes.items()
+                if count > 0
+            ],
+            ignore_conflicts=True
+        )
+        items = cls.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=changes
+        )
+        items.update(**{
+            field: F(field) + models.Case(
+                *(
+                    models.When(
+                        ingredient_id=ingredient_id,
+                        then=models.Value(change[position])
+                    )
+                    for ingredient_id, change in changes.items()
+                ),
+                default=models.Value(0),
+                output_field=models.IntegerField()
+            )
+            for position, field in enumerate(('amount', 'recipes_count'))
+        })
+        items.filter(recipes_count=0).delete()
+
+    @classmethod
+    def add_recipe(cls, user_id, recipe_id, sign=1):
+        """Учёт рецепта, добавленного в корзину пользователя."""
+        cls.apply_changes([user_id], {
+            ingredient_id: (sign * amount, sign)
+            for ingredient_id, amount in IngredientInRecipe.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('ingredient_id', 'amount')
+        })
+
+    @classmethod
+    def remove_recipe(cls, user_id, recipe_id):
+        """Учёт рецепта, удалённого из корзины пользователя."""
+        cls.add_recipe(user_id, recipe_id, sign=-1)
+
+    @classmethod
+    def change_recipe(cls, recipe_id, changes):
+        """Учёт изменения состава рецепта в корзинах пользователей."""
+        if changes:
+            cls.apply_changes(
+                ShoppingCart.objects.filter(
+                    recipes_id=recipe_id
+                ).values_list('user_id', flat=True),
+                changes
+            )
+
+    @classmethod
+    def rebuild(cls, user_ids=None, batch_size=1000):
+        """Пересборка списков покупок из корзин, возвращает число строк."""
+        items = cls.objects.all()
+        # Условие на корзины - одним filter(): второй вызов по связи
+        # многие-ко-многим добавил бы ещё одно соединение и размножил строки.
+        carts = {'recipe__shopping_cart__isnull': False}
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+            carts = {'recipe__shopping_cart__user_id__in': user_ids}
+        ingredients = IngredientInRecipe.objects.filter(**carts)
+        items.delete()
+        rows = ingredients.values_list(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(
+            total=models.Sum('amount'), count=models.Count('id')
+        ).order_by().iterator()
+        created = 0
+        while True:
+            batch = [
+                cls(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    amount=total,
+                    recipes_count=count,
+                )
+                for user_id, ingredient_id, total, count in islice(
+                    rows, batch_size
+                )
+            ]
+            if not batch:
+                return created
+            cls.objects.bulk_create(batch)
+            created += len(batch)
+
+
+class TimelineEntry(models.Model):
+    """
+    Модель записи ленты подписок.
+
+    Рецепт копируется в ленты подписчиков при публикации, если у автора
+    не больше FEED_FANOUT_MAX_FOLLOWERS подписчиков. Рецепты более
+    популярных авторов добавляются в ленту при чтении, а когда автор
+    перестаёт быть популярным, его рецепты снова копируются в ленты.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Добавлено')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.recipe}'
+
+    @staticmethod
+    def is_popular(author_id):
+        return User.objects.filter(
+            pk=author_id, followers_count__gt=FEED_FANOUT_MAX_FOLLOWERS
+        ).exists()
+
+    @classmethod
+    def fan_out(cls, recipe):
+        """Добавление нового рецепта в ленты подписчиков автора."""
+        cls.fan_out_many([recipe])
+
+    @classmethod
+    def fan_out_many(cls, recipes):
+        """Добавление новых рецептов в ленты подписчиков их авторов."""
+        followers = defaultdict(list)
+        for user_id, author_id in User.objects.filter(
+            pk__in={recipe.author_id for recipe in recipes},
+            followers_count__lte=FEED_FANOUT_MAX_FOLLOWERS,
+            subscriptions__isnull=False
+        ).values_list('subscriptions__user_id', 'id'):
+            followers[author_id].append(user_id)
+        cls.objects.bulk_create(
+            [
+                cls(
+                    user_id=user_id, recipe=recipe,
+                    author_id=recipe.author_id, pub_date=recipe.pub_date
+                )
+                for recipe in recipes
+                for user_id in followers[recipe.author_id]
+            ],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+    @classmethod
+    def backfill(cls, user_id, author_id):
+        """Последние рецепты автора в ленте нового подписчика."""
+        if cls.is_popular(author_id):
+            return
+        cls.objects.bulk_create(
+            [
+                cls(
+                    user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, pub_date=pub_date
+                )
+                for recipe_id, pub_date in Recipe.objects.filter(
+                    author_id=author_id
+                ).order_by('-pub_date', '-id').values_list(
+                    'id', 'pub_date'
+                )[:FEED_BACKFILL_RECIPES]
+            ],
+            ignore_conflicts=True
+        )
+
+    @classmethod
+    def backfill_followers(cls, author_id, batch_size=1000):
+        """
+        Последние рецепты автора в лентах всех его подписчиков.
+
+        Нужна, когда автор перестаёт быть популярным: пока у него было
+        больше FEED_FANOUT_MAX_FOLLOWERS подписчиков, его рецепты
+        не копировались в ленты, а новые подписчики не получали backfill.
+        """
+        recipes = list(
+            Recipe.objects.filter(author_id=author_id).order_by(
+                '-pub_date', '-id'
+            ).values_list('id', 'pub_date')[:FEED_BACKFILL_RECIPES]
+        )
+        entries = (
+            cls(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date
+            )
+            for user_id in User.objects.filter(
+                pk=author_id, subscriptions__isnull=False
+            ).values_list('subscriptions__user_id', flat=True).iterator()
+            for recipe_id, pub_date in recipes
+        )
+        while True:
+            batch = list(islice(entries, batch_size))
+            if not batch:
+                return
+            cls.objects.bulk_create(batch, ignore_conflicts=True)
+
+    @classmethod
+    def trim(cls, user_id, author_id):
+        """Удаление рецептов автора из ленты бывшего подписчика."""
+        cls.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """
+        Пересборка всех лент из подписок, возвращает число записей.
+
+        Последние рецепты авторов читаются одним запросом
+        на каждые batch_size авторов.
+        """
+        cls.objects.all().delete()
+        authors = User.objects.filter(
+            followers_count__gt=0,
+            followers_count__lte=FEED_FANOUT_MAX_FOLLOWERS
+        ).order_by('pk').values_list('pk', flat=True).iterator()
+        created = 0
+        while True:
+            author_ids = list(islice(authors, batch_size))
+            if not author_ids:
+                return created
+            followers = defaultdict(list)
+            for user_id, author_id in User.objects.filter(
+                pk__in=author_ids, subscriptions__isnull=False
+            ).values_list('subscriptions__user_id', 'id'):
+                followers[author_id].append(user_id)
+            entries = (
+                cls(
+                    user_id=user_id, recipe_id=recipe.id,
+                    author_id=recipe.author_id, pub_date=recipe.pub_date
+                )
+                for recipe in Recipe.objects.only(
+                    'id', 'author', 'pub_date'
+                ).latest_by_author(author_ids, FEED_BACKFILL_RECIPES)
+                for user_id in followers[recipe.author_id]
+            )
+            while True:
+                batch = list(islice(entries, batch_size))
+                if not batch:
+                    break
+                cls.objects.bulk_create(batch)
+                created += len(batch)
@@ -0,0 +1,48 @@
+from base64 import b64encode
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from foodgram.constants import BASE64_CHUNK_SIZE
+from foodgram.images import Base64ImageField
+
+# Описание EXIF больше первой декодированной части строки.
+EXIF_DESCRIPTION_SIZE = 60000
+
+
+def encode_jpeg(exif=None):
+    content = BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(
+        content, 'JPEG', **({'exif': exif} if exif else {})
+    )
+    return b64encode(content.getvalue()).decode()
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+    """Проверка заголовка изображения, переданного строкой base64."""
+
+    def test_jpeg(self):
+        upload = Base64ImageField().to_internal_value(encode_jpeg())
+        self.assertTrue(upload.name.endswith('.jpg'))
+        self.assertEqual(upload.content_type, 'image/jpeg')
+
+    def test_jpeg_with_large_exif(self):
+        exif = Image.Exif()
+        exif[0x010e] = 'x' * EXIF_DESCRIPTION_SIZE
+        data = encode_jpeg(exif.tobytes())
+        self.assertGreater(len(data), BASE64_CHUNK_SIZE)
+        upload = Base64ImageField().to_internal_value(data)
+        self.assertTrue(upload.name.endswith('.jpg'))
+        self.assertEqual(upload.size, len(data) // 4 * 3 - data.count('='))
+
+    def test_truncated_jpeg(self):
+        data = encode_jpeg()
+        with self.assertRaises(ValidationError):
+            Base64ImageField().to_internal_value(data[:64])
+
+    def test_not_image(self):
+        data = b64encode(b'not an image' * 100).decode()
+        with self.assertRaises(ValidationError):
+            Base64ImageField().to_internal_value(data)
@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class RecipeDocumentCacheTest(TestCase):
+    """Документ рецепта в кэше меняется вместе с рецептом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Рецепт',
+            image='recipes/recipe_images/recipe.jpg',
+            text='Описание', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_changed_elsewhere(self):
+        client = APIClient()
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.assertEqual(client.get(url).data['name'], 'Рецепт')
+        # Другой процесс меняет рецепт, не трогая этот кэш.
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            name='Новый рецепт',
+            updated_at=self.recipe.updated_at + timedelta(seconds=1)
+        )
+        self.assertEqual(client.get(url).data['name'], 'Новый рецепт')
@@ -0,0 +1,111 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscribe
+
+User = get_user_model()
+
+RECIPES = 12
+LIMITS = (2, 6)
+# Запросы страницы и рецепта не зависят от размера страницы.
+LIST_QUERIES = {'anonymous': 5, 'authenticated': 7}
+DETAIL_QUERIES = {'anonymous': 4, 'authenticated': 6}
+# Удаление из корзины ещё пересобирает список покупок.
+BULK_DELETE_QUERIES = {
+    'favorite': (Favorite, 7),
+    'shopping_cart': (ShoppingCart, 10),
+}
+
+
+class RecipeQueriesTest(TestCase):
+    """Число запросов чтения рецептов постоянно."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password'
+        )
+        cls.viewer = User.objects.create_user(
+            email='viewer@example.com', username='viewer',
+            first_name='Читатель', last_name='Рецептов', password='password'
+        )
+        tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag{index}')
+            for index in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(5)
+        ]
+        for index in range(RECIPES):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {index}',
+                image='recipes/recipe_images/recipe.jpg',
+                text='Описание', cooking_time=10 + index
+            )
+            recipe.tags.set(tags[index % 2:index % 2 + 2])
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=index + 1
+                )
+                for ingredient in ingredients[index % 3:index % 3 + 3]
+            )
+            if index % 2:
+                Favorite.objects.create(user=cls.viewer, recipes=recipe)
+            if index % 3 == 0:
+                ShoppingCart.objects.create(user=cls.viewer, recipes=recipe)
+        Subscribe.objects.create(user=cls.viewer, subscriptions=cls.author)
+        cls.recipe = Recipe.objects.order_by('-pub_date').first()
+        cls.token = Token.objects.create(user=cls.viewer)
+
+    def get_clients(self):
+        anonymous = APIClient()
+        authenticated = APIClient()
+        authenticated.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        return {'anonymous': anonymous, 'authenticated': authenticated}
+
+    def test_list_queries(self):
+        for viewer, client in self.get_clients().items():
+            for limit in LIMITS:
+                with self.subTest(viewer=viewer, limit=limit):
+                    # Готовые документы рецептов сэкономили бы запросы.
+                    cache.clear()
+                    with self.assertNumQueries(LIST_QUERIES[viewer]):
+                        response = client.get(
+                            '/api/recipes/', {'limit': limit}
+                        )
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.data['results']), limit)
+
+    def test_detail_queries(self):
+        for viewer, client in self.get_clients().items():
+            with self.subTest(viewer=viewer):
+                cache.clear()
+                with self.assertNumQueries(DETAIL_QUERIES[viewer]):
+                    response = client.get(f'/api/recipes/{self.recipe.pk}/')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['id'], self.recipe.pk)
+
+    def test_bulk_delete_queries(self):
+        client = self.get_clients()['authenticated']
+        recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        for path, (model, queries) in BULK_DELETE_QUERIES.items():
+            for limit in LIMITS:
+                with self.subTest(path=path, limit=limit):
+                    data = {'recipes': recipe_ids[:limit]}
+                    url = f'/api/recipes/{path}/bulk/'
+                    client.post(url, data, format='json')
+                    with self.assertNumQueries(queries):
+                        response = client.delete(url, data, format='json')
+                    self.assertEqual(response.status_code, 204)
+                    self.assertFalse(model.objects.filter(
+                        user=self.viewer, recipes__in=data['recipes']
+                    ).exists())
@@ -0,0 +1,85 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShoppingListItem, Tag)
+
+User = get_user_model()
+
+
+class ShoppingListTest(TestCase):
+    """Список покупок следует за изменениями рецептов в корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com', username='author',
+            first_name='Автор', last_name='Рецептов', password='password'
+        )
+        cls.tag = Tag.objects.create(name='Тег', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г'
+            )
+            for index in range(3)
+        ]
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт',
+            image='recipes/recipe_images/recipe.jpg',
+            text='Описание', cooking_time=10
+        )
+        cls.recipe.tags.set([cls.tag])
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=cls.recipe, ingredient=ingredient, amount=10
+            )
+            for ingredient in cls.ingredients[:2]
+        )
+        # Второй рецепт корзины держит в списке убранный ингредиент.
+        other = Recipe.objects.create(
+            author=cls.author, name='Другой рецепт',
+            image='recipes/recipe_images/recipe.jpg',
+            text='Описание', cooking_time=10
+        )
+        IngredientInRecipe.objects.create(
+            recipe=other, ingredient=cls.ingredients[1], amount=7
+        )
+        for recipe in (cls.recipe, other):
+            ShoppingCart.objects.create(user=cls.author, recipes=recipe)
+        cls.token = Token.objects.create(user=cls.author)
+
+    def shopping_list(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.author).values_list(
+                'ingredient_id', 'amount'
+            )
+        )
+
+    def test_recipe_ingredients_replaced(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        first, second, third = self.ingredients
+        response = client.patch(
+            f'/api/recipes/{self.recipe.pk}/', {
+                'ingredients': [
+                    {'id': first.pk, 'amount': 15},
+                    {'id': third.pk, 'amount': 5},
+                ],
+                'tags': [self.tag.pk],
+                'name': 'Рецепт',
+                'text': 'Описание',
+                'cooking_time': 10,
+            }, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.shopping_list(), {first.pk: 15, second.pk: 7, third.pk: 5}
+        )
+        self.assertEqual(
+            set(self.recipe.ingredients_list.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {(first.pk, 15), (third.pk, 5)}
+        )
@@ -0,0 +1,62 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from api.feed import SubscriptionFeed
+from recipes.models import Recipe
+from users.models import Subscribe
+
+User = get_user_model()
+
+FANOUT_MAX_FOLLOWERS = 2
+
+
+@mock.patch('api.feed.FEED_FANOUT_MAX_FOLLOWERS', FANOUT_MAX_FOLLOWERS)
+@mock.patch('api.signals.FEED_FANOUT_MAX_FOLLOWERS', FANOUT_MAX_FOLLOWERS)
+@mock.patch('recipes.models.FEED_FANOUT_MAX_FOLLOWERS', FANOUT_MAX_FOLLOWERS)
+class SubscriptionFeedTest(TestCase):
+    """Лента подписок при смене популярности автора."""
+
+    def create_user(self, name):
+        return User.objects.create_user(
+            email=f'{name}@example.com', username=name,
+            first_name=name, last_name=name, password='password'
+        )
+
+    def create_recipe(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name,
+            image='recipes/recipe_images/recipe.jpg',
+            text='Описание', cooking_time=10
+        )
+
+    def feed(self, user):
+        return [
+            recipe.id
+            for recipe in SubscriptionFeed(user).page(None, 10)
+        ]
+
+    def setUp(self):
+        self.author = self.create_user('author')
+        self.followers = [
+            self.create_user(f'follower{index}')
+            for index in range(FANOUT_MAX_FOLLOWERS + 1)
+        ]
+
+    def test_author_stops_being_popular(self):
+        early = self.create_recipe('До популярности')
+        for follower in self.followers[:FANOUT_MAX_FOLLOWERS]:
+            Subscribe.objects.create(user=follower, subscriptions=self.author)
+        latecomer = self.followers[-1]
+        # Третий подписчик делает автора популярным.
+        Subscribe.objects.create(user=latecomer, subscriptions=self.author)
+        popular = self.create_recipe('Во время популярности')
+        expected = [popular.id, early.id]
+        for follower in self.followers:
+            self.assertEqual(self.feed(follower), expected)
+        with self.captureOnCommitCallbacks(execute=True):
+            Subscribe.objects.filter(user=self.followers[0]).delete()
+        for follower in self.followers[1:]:
+            self.assertEqual(self.feed(follower), expected)
+        self.assertEqual(self.feed(self.followers[0]), [])
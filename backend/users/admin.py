@@ -17,5 +17,6 @@ class SubscribeAdmin(admin.ModelAdmin):
 UserAdmin.fieldsets += (
     ('Extra Fields', {'fields': ('avatar',)}),
 )
+UserAdmin.list_display += ('recipes_count', 'followers_count',)
 admin.site.register(MyUser, UserAdmin)
 admin.site.register(Subscribe, SubscribeAdmin)
@@ -4,3 +4,5 @@ USERNAME_MAX_LENGTH = 150
 FIRST_NAME_MAX_LENGTH = 150
 LAST_NAME_MAX_LENGTH = 150
 LIST_PER_PAGE = 15
+VIEWER_STATE_FULL_LOAD_LIMIT = 1000
+AVATAR_IMAGE_VARIANTS = {'avatar': (160, 160)}
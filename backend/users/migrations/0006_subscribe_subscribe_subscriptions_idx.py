@@ -0,0 +1,20 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:13
+
+from django.db import migrations, models
+
+from foodgram.operations import AddIndexConcurrentlyIfSupported
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('users', '0005_alter_myuser_username'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfSupported(
+            model_name='subscribe',
+            index=models.Index(fields=['subscriptions', 'user'], name='subscribe_subscriptions_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+from foodgram.counters import count_of
+
+
+def fill_followers_count(apps, schema_editor):
+    MyUser = apps.get_model('users', 'MyUser')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    MyUser.objects.update(
+        followers_count=count_of(Subscribe, 'subscriptions')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_subscribe_subscribe_subscriptions_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunPython(fill_followers_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 18:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_myuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='avatar_variants',
+            field=models.JSONField(default=dict, editable=False, verbose_name='Копии аватара'),
+        ),
+    ]
@@ -3,12 +3,15 @@ from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.core.exceptions import ValidationError
 from django.db import models
 
+from foodgram.counters import CounterFieldsMixin
+
 from .constants import (EMAIL_MAX_LENGTH, FIRST_NAME_MAX_LENGTH,
                         LAST_NAME_MAX_LENGTH, USERNAME_MAX_LENGTH)
 
 
-class MyUser(AbstractUser):
+class MyUser(CounterFieldsMixin, AbstractUser):
     """Кастомная модель пользователя."""
+    COUNTER_FIELDS = ('recipes_count', 'followers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = [
         'username',
@@ -49,6 +52,21 @@ class MyUser(AbstractUser):
         default=None,
         blank=True
     )
+    avatar_variants = models.JSONField(
+        'Копии аватара',
+        default=dict,
+        editable=False
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        'Подписчиков',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ['id']
@@ -81,6 +99,12 @@ class Subscribe(models.Model):
                 name='unique_user_subscriptions'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['subscriptions', 'user'],
+                name='subscribe_subscriptions_idx'
+            ),
+        ]
 
     def clean(self):
         if self.user == self.subscriptions:
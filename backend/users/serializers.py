@@ -1,34 +1,53 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.db.models import Manager
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
+from foodgram.images import Base64ImageField, ImageVariantsField
 from recipes.models import Recipe
 from rest_framework import status
-from rest_framework.fields import SerializerMethodField
-from rest_framework.serializers import ModelSerializer
+from rest_framework.fields import (IntegerField, ReadOnlyField,
+                                   SerializerMethodField)
+from rest_framework.serializers import (ListSerializer, ModelSerializer,
+                                        Serializer)
 
-from .models import Subscribe
+from .viewer_state import get_viewer_state
 
 User = get_user_model()
 
 
+class ViewerStateListSerializer(ListSerializer):
+    """Список, загружающий состояние пользователя для всей страницы."""
+
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, Manager) else data
+        request = self.context.get('request')
+        if request is not None:
+            recipe_ids, author_ids = self.child.get_viewer_ids(items)
+            get_viewer_state(request).prime(recipe_ids, author_ids)
+        return super().to_representation(items)
+
+
 class MyUserSerializer(UserSerializer):
     """Сериализатор для пользователей."""
     is_subscribed = SerializerMethodField(read_only=True)
+    avatar_variants = ImageVariantsField('avatar')
+
+    def get_viewer_ids(self, users):
+        """Рецепты и авторы, для которых нужно состояние пользователя."""
+        return (), [user.id for user in users]
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Subscribe.objects.filter(user=user, subscriptions=obj).exists()
+        state = get_viewer_state(self.context.get('request'))
+        return state.is_subscribed(obj.id)
 
     class Meta:
         model = User
+        list_serializer_class = ViewerStateListSerializer
         fields = (
             'email', 'id',
             'username', 'first_name',
             'last_name', 'is_subscribed',
-            'avatar',
+            'avatar', 'avatar_variants',
         )
 
 
@@ -48,19 +67,39 @@ class AvatarSerializer(ModelSerializer):
 
 class RecipeForSubscriptionSerializer(ModelSerializer):
     """Сериализатор для рецептов пользователей-авторов."""
+    image_variants = ImageVariantsField('image')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time',)
+
+
+class RecipesLimitSerializer(Serializer):
+    """Сериализатор параметра recipes_limit."""
+    recipes_limit = IntegerField(min_value=1, required=False)
+
+
+class SubscribeListSerializer(ViewerStateListSerializer):
+    """Список подписок, загружающий рецепты всех авторов страницы."""
+
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, Manager) else data
+        self.child.load_recipes(items)
+        return super().to_representation(items)
 
 
 class SubscribeSerializer(MyUserSerializer):
-    """Сериализатор для подписок."""
-    recipes_count = SerializerMethodField()
+    """
+    Сериализатор для подписок.
+
+    Число рецептов в контексте передаётся как recipes_limit.
+    """
+    recipes_count = ReadOnlyField()
     recipes = SerializerMethodField()
 
     class Meta:
         model = User
+        list_serializer_class = SubscribeListSerializer
         fields = (
             'email', 'id', 'username', 'first_name',
             'last_name', 'is_subscribed', 'avatar',
@@ -70,9 +109,9 @@ class SubscribeSerializer(MyUserSerializer):
 
     def validate(self, data):
         subscriptions = self.instance
-        user = self.context.get('request').user
-        if Subscribe.objects.filter(
-                subscriptions=subscriptions, user=user).exists():
+        request = self.context.get('request')
+        user = request.user
+        if get_viewer_state(request).is_subscribed(subscriptions.id):
             raise ValidationError(
                 message='Вы уже подписаны на этого пользователя.',
                 code=status.HTTP_400_BAD_REQUEST
@@ -84,16 +123,20 @@ class SubscribeSerializer(MyUserSerializer):
             )
         return data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+    def load_recipes(self, authors):
+        """Последние рецепты авторов одним запросом."""
+        recipes = {author.id: [] for author in authors}
+        for recipe in Recipe.objects.only(
+            *RecipeForSubscriptionSerializer.Meta.fields, 'author'
+        ).latest_by_author(recipes, self.context.get('recipes_limit')):
+            recipes[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = recipes[author.id]
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if not hasattr(obj, 'latest_recipes'):
+            self.load_recipes([obj])
         serializer = RecipeForSubscriptionSerializer(
-            recipes, many=True, read_only=True
+            obj.latest_recipes, many=True, read_only=True
         )
         return serializer.data
@@ -0,0 +1,124 @@
+"""Состояние просматривающего пользователя в рамках одного запроса."""
+from django.db.models import IntegerField, Value
+
+from recipes.models import Favorite, ShoppingCart
+
+from .constants import VIEWER_STATE_FULL_LOAD_LIMIT
+from .models import Subscribe
+
+FAVORITE, SHOPPING_CART, SUBSCRIPTION = range(3)
+
+
+class ViewerState:
+    """
+    Избранное, корзина покупок и подписки пользователя.
+
+    Всё состояние загружается одним UNION-запросом. Если записей больше
+    VIEWER_STATE_FULL_LOAD_LIMIT, состояние догружается IN-запросами
+    только по рецептам и авторам текущей страницы. На себя пользователь
+    подписаться не может, поэтому свой id в запросы не попадает.
+    """
+
+    def __init__(self, user, limit=VIEWER_STATE_FULL_LOAD_LIMIT):
+        self.user = user
+        self.limit = limit
+        self.favorites = set()
+        self.shopping_cart = set()
+        self.subscriptions = set()
+        self.complete = not user.is_authenticated
+        self._full_load_tried = False
+        self._known_recipes = set()
+        self._known_authors = set()
+
+    def _rows(self, recipe_ids=None, author_ids=None):
+        """Общий запрос (вид записи, id) по трём таблицам."""
+        parts = []
+        if recipe_ids is None or recipe_ids:
+            for kind, model in (
+                (FAVORITE, Favorite), (SHOPPING_CART, ShoppingCart)
+            ):
+                queryset = model.objects.filter(user=self.user)
+                if recipe_ids is not None:
+                    queryset = queryset.filter(recipes_id__in=recipe_ids)
+                parts.append((kind, queryset, 'recipes_id'))
+        if author_ids is None or author_ids:
+            queryset = Subscribe.objects.filter(user=self.user)
+            if author_ids is not None:
+                queryset = queryset.filter(subscriptions_id__in=author_ids)
+            parts.append((SUBSCRIPTION, queryset, 'subscriptions_id'))
+        first, *rest = [
+            queryset.order_by().annotate(
+                kind=Value(kind, output_field=IntegerField())
+            ).values_list(field, 'kind')
+            for kind, queryset, field in parts
+        ]
+        return first.union(*rest, all=True) if rest else first
+
+    def _store(self, rows):
+        sets = {
+            FAVORITE: self.favorites,
+            SHOPPING_CART: self.shopping_cart,
+            SUBSCRIPTION: self.subscriptions,
+        }
+        for pk, kind in rows:
+            sets[kind].add(pk)
+
+    def load(self):
+        """Загрузка всего состояния, если оно не превышает лимит."""
+        if self.complete or self._full_load_tried:
+            return self.complete
+        self._full_load_tried = True
+        rows = list(self._rows()[:self.limit + 1])
+        if len(rows) > self.limit:
+            return False
+        self._store(rows)
+        self.complete = True
+        return True
+
+    def prime(self, recipe_ids=(), author_ids=()):
+        """
+        Догрузка состояния для рецептов и авторов страницы.
+
+        Всё состояние загружается, только когда нужны признаки рецептов.
+        Для списков пользователей хватает одного IN-запроса к подпискам.
+        """
+        if self.complete:
+            return
+        recipe_ids = set(recipe_ids) - self._known_recipes
+        author_ids = set(author_ids) - self._known_authors
+        author_ids.discard(self.user.pk)
+        if not recipe_ids and not author_ids:
+            return
+        if recipe_ids and self.load():
+            return
+        self._store(self._rows(recipe_ids, author_ids))
+        self._known_recipes |= recipe_ids
+        self._known_authors |= author_ids
+
+    def is_favorited(self, recipe_id):
+        self.prime(recipe_ids=(recipe_id,))
+        return recipe_id in self.favorites
+
+    def is_in_shopping_cart(self, recipe_id):
+        self.prime(recipe_ids=(recipe_id,))
+        return recipe_id in self.shopping_cart
+
+    def is_subscribed(self, author_id):
+        if author_id == self.user.pk:
+            return False
+        self.prime(author_ids=(author_id,))
+        return author_id in self.subscriptions
+
+    def mark_subscribed(self, author_id):
+        """Учёт подписки, созданной в текущем запросе."""
+        self.subscriptions.add(author_id)
+        self._known_authors.add(author_id)
+
+
+def get_viewer_state(request):
+    """Состояние пользователя, закреплённое за запросом."""
+    state = getattr(request, '_viewer_state', None)
+    if state is None:
+        state = ViewerState(request.user)
+        request._viewer_state = state
+    return state
@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.db.transaction import atomic
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework.decorators import action
@@ -9,7 +10,8 @@ from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
 
 from .permissions import CurrentUserOrAdmin
 from .serializers import (AvatarSerializer, MyUserSerializer,
-                          SubscribeSerializer)
+                          RecipesLimitSerializer, SubscribeSerializer)
+from .viewer_state import get_viewer_state
 from users.models import Subscribe
 
 User = get_user_model()
@@ -43,8 +45,13 @@ class MyUserViewSet(UserViewSet):
 
     @avatar.mapping.delete
     def delete_avatar(self, request):
-        if request.user.avatar:
-            request.user.avatar.delete()
+        user = request.user
+        if user.avatar:
+            # Файл может быть и у других пользователей, его удалит
+            # команда collect_media_garbage.
+            user.avatar = None
+            user.avatar_variants = {}
+            user.save(update_fields=['avatar', 'avatar_variants'])
         return Response(status=HTTP_204_NO_CONTENT)
 
     @action(
@@ -61,10 +68,14 @@ class MyUserViewSet(UserViewSet):
             serializer = SubscribeSerializer(
                 subscriptions,
                 data=request.data,
-                context={'request': request}
+                context=self.get_subscribe_context()
             )
             serializer.is_valid(raise_exception=True)
-            Subscribe.objects.create(user=user, subscriptions=subscriptions)
+            with atomic():
+                Subscribe.objects.create(
+                    user=user, subscriptions=subscriptions
+                )
+            get_viewer_state(request).mark_subscribed(subscriptions.id)
             return Response(serializer.data, status=HTTP_201_CREATED)
         if request.method == 'DELETE':
             to_subscribe = Subscribe.objects.filter(
@@ -85,11 +96,21 @@ class MyUserViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = request.user
+        context = self.get_subscribe_context()
         queryset = User.objects.filter(subscriptions__user=user)
         pages = self.paginate_queryset(queryset)
         serializer = SubscribeSerializer(
             pages,
             many=True,
-            context={'request': request}
+            context=context
         )
         return self.get_paginated_response(serializer.data)
+
+    def get_subscribe_context(self):
+        """Контекст сериализатора подписок с проверенным recipes_limit."""
+        serializer = RecipesLimitSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return {
+            'request': self.request,
+            'recipes_limit': serializer.validated_data.get('recipes_limit'),
+        }